@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ASGI Entry Point for the Read-Only API
+
+Serves the read-only JSON API (languages, tags, examples and graphs) with
+async handlers, so that a slow client downloading a large payload holds
+an idle coroutine instead of a worker thread. Payloads are built by the
+Flask views in a thread pool, once per `ASGI_PAYLOAD_CACHE_TTL` seconds
+or tagset reload, and cached as bytes (with their gzip encoding); the
+languages and tag lists are built on startup.
+
+    $ uvicorn asgi:app --proxy-headers
+
+Other requests are handed to the Flask application if `asgiref` is
+installed; otherwise they should be routed to the WSGI server, e.g. in
+nginx:
+
+    location /api/ { proxy_pass http://127.0.0.1:8001; }   # ASGI
+    location / { proxy_pass http://127.0.0.1:8000; }       # WSGI
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import gzip
+import asyncio
+import hashlib
+import functools
+import logging
+from http.cookies import SimpleCookie
+
+from itsdangerous import BadSignature
+from limits import parse as parse_limit
+from werkzeug.exceptions import HTTPException
+
+try:
+    from asgiref.wsgi import WsgiToAsgi
+except ImportError:
+    WsgiToAsgi = None
+
+import settings
+from server import webapp, limiter, load_user
+from utils.cache import TTLCache
+from utils.tagset import TAGSET
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+###############################################################################
+
+CHUNK_SIZE = 64 * 1024
+
+# read-only endpoints served by this application
+PUBLIC_ENDPOINTS = {"list_languages", "list_tags"}
+PRIVATE_ENDPOINTS = {
+    "list_category_tags", "get_category_tags", "get_category_pivot",
+    "get_category_graphs"
+}
+
+RATE_LIMIT = parse_limit(settings.RATE_LIMIT_DEFAULT)
+
+###############################################################################
+
+
+class Payload:
+    """Prebuilt response body"""
+
+    def __init__(self, status: int, content_type: str, body: bytes):
+        self.status = status
+        self.content_type = content_type
+        self.body = body
+        self.etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        self.gzip_body = (
+            gzip.compress(body, compresslevel=settings.COMPRESS_LEVEL, mtime=0)
+            if settings.COMPRESS_RESPONSES
+            and len(body) >= settings.COMPRESS_MIN_SIZE
+            else None
+        )
+
+
+class APIApplication:
+    """ASGI application for the read-only API
+
+    Requests are matched against the Flask URL map. Only the endpoints in
+    `PUBLIC_ENDPOINTS` and `PRIVATE_ENDPOINTS` (the latter for users logged
+    in through the Flask session cookie) are served here.
+
+    Parameters
+    ----------
+    flask_app : Flask
+        Flask application whose views build the payloads
+    fallback : ASGI application, optional
+        Application for every other request
+    """
+
+    def __init__(self, flask_app, fallback=None):
+        self.flask_app = flask_app
+        self.fallback = fallback
+        self.payloads = TTLCache(
+            ttl=settings.ASGI_PAYLOAD_CACHE_TTL,
+            maxsize=settings.ASGI_PAYLOAD_CACHE_SIZE
+        )
+        # one build per payload, however many requests are waiting for it
+        self.pending = {}
+        TAGSET.on_reload(lambda tagset: self.payloads.clear())
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+
+        try:
+            endpoint, view_args = self.flask_app.url_map.bind(
+                "", script_name=root_path or None
+            ).match(path, method=scope["method"])
+        except HTTPException:
+            endpoint = None
+
+        if endpoint not in PUBLIC_ENDPOINTS | PRIVATE_ENDPOINTS:
+            if self.fallback is not None:
+                await self.fallback(scope, receive, send)
+            else:
+                await self.send_json(send, 404, b'{"message": "Not Found"}')
+            return
+
+        if scope["method"] == "HEAD":
+            send = functools.partial(self.send_without_body, send)
+
+        headers = {
+            name.decode("latin-1").lower(): value.decode("latin-1")
+            for name, value in scope.get("headers", [])
+        }
+
+        client = (scope.get("client") or ("unknown",))[0]
+        if limiter.enabled and not await asyncio.to_thread(
+            limiter.limiter.hit, RATE_LIMIT, "asgi", client, endpoint
+        ):
+            await self.send_json(
+                send, 429, b'{"message": "Too Many Requests"}'
+            )
+            return
+
+        if endpoint in PRIVATE_ENDPOINTS and not await self.is_authenticated(
+            headers.get("cookie", "")
+        ):
+            await self.send_unauthorized(send, headers, root_path)
+            return
+
+        try:
+            payload = await self.get_payload(endpoint, view_args)
+        except Exception:
+            LOGGER.exception(f"Could not build payload for {path}")
+            await self.send_json(
+                send, 500, b'{"message": "Internal Server Error"}'
+            )
+            return
+        await self.send_payload(send, payload, headers)
+
+    # ----------------------------------------------------------------------- #
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await self.warm_up()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def warm_up(self):
+        """Build the payloads of the languages and of the tag lists, so
+        that the first requests for them are not cold"""
+        requests = [("list_languages", {}), ("list_tags", {})] + [
+            ("list_category_tags", {"tag_category": category})
+            for category in TAGSET.get().categories
+        ]
+        for endpoint, view_args in requests:
+            try:
+                await self.get_payload(endpoint, view_args)
+            except Exception:
+                LOGGER.exception(f"Could not warm up {endpoint}")
+
+    async def is_authenticated(self, cookie_header: str) -> bool:
+        """Check the user id stored in the Flask session cookie"""
+        cookie = SimpleCookie()
+        cookie.load(cookie_header)
+        morsel = cookie.get(self.flask_app.config["SESSION_COOKIE_NAME"])
+        if morsel is None:
+            return False
+
+        serializer = self.flask_app.session_interface.get_signing_serializer(
+            self.flask_app
+        )
+        try:
+            session = serializer.loads(
+                morsel.value,
+                max_age=int(
+                    self.flask_app.permanent_session_lifetime.total_seconds()
+                )
+            )
+        except BadSignature:
+            return False
+
+        user_id = session.get("_user_id")
+        if user_id is None:
+            return False
+        user = await asyncio.to_thread(self.load_user, user_id)
+        return user is not None and not user.is_deleted
+
+    def load_user(self, user_id):
+        with self.flask_app.app_context():
+            return load_user(user_id)
+
+    # ----------------------------------------------------------------------- #
+
+    def build_payload(self, endpoint: str, view_args: dict) -> Payload:
+        view = self.flask_app.view_functions[endpoint]
+        # skip `login_required`, authentication is checked by the caller
+        view = getattr(view, "__wrapped__", view)
+        with self.flask_app.app_context():
+            response = self.flask_app.make_response(view(**view_args))
+            return Payload(
+                response.status_code,
+                response.content_type,
+                response.get_data()
+            )
+
+    async def get_payload(self, endpoint: str, view_args: dict) -> Payload:
+        key = (endpoint, tuple(sorted(view_args.items())))
+        payload = self.payloads.get(key)
+        if payload is not None:
+            return payload
+
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.ensure_future(
+                asyncio.to_thread(self.build_payload, endpoint, view_args)
+            )
+            future.add_done_callback(functools.partial(self.payload_built, key))
+            self.pending[key] = future
+        # a disconnecting client must not cancel the build for the others
+        return await asyncio.shield(future)
+
+    def payload_built(self, key, future):
+        del self.pending[key]
+        if future.cancelled() or future.exception() is not None:
+            return
+        payload = future.result()
+        if payload.status == 200:
+            self.payloads.set(key, payload)
+
+    # ----------------------------------------------------------------------- #
+
+    @staticmethod
+    async def send_without_body(send, message: dict):
+        """`send` for HEAD requests: the headers of the GET response (with
+        its content length) and an empty body"""
+        if message["type"] == "http.response.body":
+            if message.get("more_body"):
+                return
+            message = {"type": "http.response.body", "body": b""}
+        await send(message)
+
+    @staticmethod
+    async def send_json(send, status: int, body: bytes, headers: list = None):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+            ] + (headers or []),
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def send_unauthorized(self, send, headers: dict, root_path: str):
+        if headers.get("x-requested-with") == "XMLHttpRequest":
+            await self.send_json(
+                send, 200,
+                b'{"success": false, "unauthorized": true, '
+                b'"message": "Login required.", "style": "warning"}'
+            )
+        else:
+            await send({
+                "type": "http.response.start",
+                "status": 302,
+                "headers": [
+                    (b"location", f"{root_path}/login".encode("latin-1")),
+                    (b"content-length", b"0"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": b""})
+
+    @staticmethod
+    async def send_payload(send, payload: Payload, headers: dict):
+        use_gzip = (
+            payload.gzip_body is not None
+            and "gzip" in headers.get("accept-encoding", "")
+        )
+        etag = f'{payload.etag[:-1]}-gzip"' if use_gzip else payload.etag
+        response_headers = [
+            (b"content-type", payload.content_type.encode("latin-1")),
+            (b"etag", etag.encode("latin-1")),
+            (b"vary", b"Accept-Encoding, Cookie"),
+        ]
+
+        if_none_match = headers.get("if-none-match", "")
+        if etag in [tag.strip() for tag in if_none_match.split(",")]:
+            await send({
+                "type": "http.response.start",
+                "status": 304,
+                "headers": response_headers[1:],
+            })
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        body = payload.gzip_body if use_gzip else payload.body
+        if use_gzip:
+            response_headers.append((b"content-encoding", b"gzip"))
+        response_headers.append(
+            (b"content-length", str(len(body)).encode("latin-1"))
+        )
+        await send({
+            "type": "http.response.start",
+            "status": payload.status,
+            "headers": response_headers,
+        })
+        # `send` waits for slow clients between chunks
+        for start in range(0, len(body), CHUNK_SIZE):
+            await send({
+                "type": "http.response.body",
+                "body": body[start:start + CHUNK_SIZE],
+                "more_body": start + CHUNK_SIZE < len(body),
+            })
+        if not body:
+            await send({"type": "http.response.body", "body": b""})
+
+
+###############################################################################
+
+app = APIApplication(
+    webapp,
+    fallback=WsgiToAsgi(webapp) if WsgiToAsgi is not None else None
+)
+
+###############################################################################
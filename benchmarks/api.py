@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+API Benchmark
+
+Builds databases at several multiples of the shipped `data/*.csv` volume
+and drives every API route (and login) through the Flask test client,
+reporting latency percentiles, SQL statement counts and peak memory per
+route. Results can be saved as a baseline and later runs compared against
+it to catch regressions.
+
+    $ python3 benchmarks/api.py --scales 1,100 --save-baseline
+    $ python3 benchmarks/api.py --scales 1,100
+
+With `--synthetic`, the databases are filled by `generate.py` instead of
+replicating the shipped rows.
+
+Every scale is benchmarked in a fresh process, as `server` binds to its
+database at import time.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import resource
+import tempfile
+import tracemalloc
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+sys.path.insert(1, os.path.dirname(os.path.realpath(__file__)))
+
+###############################################################################
+
+BENCHMARK_DIR = os.path.dirname(os.path.realpath(__file__))
+DEFAULT_BASELINE = os.path.join(BENCHMARK_DIR, "baseline.json")
+DEFAULT_DB_DIR = os.path.join(tempfile.gettempdir(), "samanvaya-benchmark")
+
+INSERT_CHUNK_SIZE = 10000
+
+###############################################################################
+
+
+def load_server(db_path: str):
+    """Import `server` bound to the database at `db_path`"""
+    import settings
+    settings.DATABASE_URI = f"sqlite:///{db_path}"
+    settings.LOG_FILE = os.path.join(os.path.dirname(db_path), "benchmark.log")
+
+    import server
+    server.webapp.config["WTF_CSRF_ENABLED"] = False
+    server.webapp.config["TESTING"] = True
+    server.limiter.enabled = False
+    return server
+
+
+def scale_database(scale: int):
+    """Replicate the seeded tags and examples so that there are `scale`
+    copies of each
+
+    Tags are copied with a suffixed code, and the examples of each copy
+    refer to the corresponding copy of their tag.
+    Must be called inside an application context.
+    """
+    from sqlalchemy import insert, select
+    from models import db, TAG_MODEL_MAP
+
+    for model_tag, model_data in TAG_MODEL_MAP.values():
+        tag_columns = [
+            c.key for c in model_tag.__table__.columns if c.key != "id"
+        ]
+        data_columns = [
+            c.key for c in model_data.__table__.columns if c.key != "id"
+        ]
+        tags = [
+            row._asdict()
+            for row in db.session.execute(
+                select(model_tag.id, *[getattr(model_tag, c) for c in tag_columns])
+            )
+        ]
+        data = [
+            row._asdict()
+            for row in db.session.execute(
+                select(*[getattr(model_data, c) for c in data_columns])
+            )
+        ]
+        if not tags:
+            continue
+
+        max_id = max(tag["id"] for tag in tags)
+        for copy in range(1, scale):
+            offset = copy * max_id
+            tag_rows = [
+                dict(tag, id=tag["id"] + offset, code=f"{tag['code']}_{copy}")
+                for tag in tags
+            ]
+            data_rows = [
+                dict(row, tag_id=row["tag_id"] + offset) for row in data
+            ]
+            for rows, model in [(tag_rows, model_tag), (data_rows, model_data)]:
+                for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+                    db.session.execute(
+                        insert(model), rows[start:start + INSERT_CHUNK_SIZE]
+                    )
+            db.session.commit()
+
+
+def build_database(db_path: str, scale: int, synthetic: bool = False):
+    """Create the seeded database at `db_path` and scale it (subprocess)
+
+    With `synthetic`, the data is generated by `generate.py` instead of
+    replicating the seeded rows.
+    """
+    build_path = f"{db_path}.build"
+    if os.path.isfile(build_path):
+        os.remove(build_path)
+
+    server = load_server(build_path)
+    with server.webapp.app_context():
+        if synthetic:
+            from generate import generate
+            generate(scale)
+        elif scale > 1:
+            scale_database(scale)
+        server.db.engine.dispose()
+    os.replace(build_path, db_path)
+
+
+###############################################################################
+
+
+def percentile(values: list, fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def get_endpoints(server) -> list:
+    """(name, function(client) -> response, needs_login) for every route"""
+    from models import TAG_MODEL_MAP, GRAPH_MODEL_MAP
+
+    user = server.settings.USERS[0]
+    endpoints = [
+        ("list_languages", lambda c: c.get("/api/list/languages"), False),
+        ("list_tags", lambda c: c.get("/api/list/tags"), False),
+    ]
+    with server.webapp.app_context():
+        for category, (model_tag, _) in TAG_MODEL_MAP.items():
+            tag_ids = [
+                str(tag_id)
+                for (tag_id,) in server.db.session.query(model_tag.id)
+                .order_by(model_tag.id).limit(4)
+            ]
+            endpoints.append((
+                f"list_category_tags[{category}]",
+                lambda c, category=category: c.get(f"/api/list/{category}"),
+                True
+            ))
+            endpoints.append((
+                f"get_category_tags[{category}]",
+                lambda c, category=category, ids=",".join(tag_ids): c.get(
+                    f"/api/get/{category}/{ids}"
+                ),
+                True
+            ))
+    for category in GRAPH_MODEL_MAP:
+        endpoints.append((
+            f"get_category_graphs[{category}]",
+            lambda c, category=category: c.get(f"/api/graph/get/{category}/"),
+            True
+        ))
+    endpoints.append((
+        "post_comment",
+        lambda c: c.post("/api/post/comment", data={
+            "tablename": "sentence_meaning_tag",
+            "action": "suggest_generic",
+            "comment": "benchmark",
+            "detail": "{}",
+        }),
+        True
+    ))
+    endpoints.append((
+        "login",
+        lambda c: server.webapp.test_client().post("/login", data={
+            "username": user["username"],
+            "password": user["password"],
+        }),
+        False
+    ))
+    return endpoints
+
+
+def run_benchmark(db_path: str, iterations: int) -> dict:
+    """Benchmark every endpoint against the database at `db_path`
+    (subprocess)"""
+    from sqlalchemy import event
+
+    server = load_server(db_path)
+    user = server.settings.USERS[0]
+
+    statements = {"count": 0}
+
+    def count_statement(*args, **kwargs):
+        statements["count"] += 1
+
+    with server.webapp.app_context():
+        engine = server.db.engine
+    event.listen(engine, "before_cursor_execute", count_statement)
+
+    client = server.webapp.test_client()
+    client.post("/login", data={
+        "username": user["username"],
+        "password": user["password"],
+    })
+    anonymous_client = server.webapp.test_client()
+
+    results = {}
+    for name, request, needs_login in get_endpoints(server):
+        _client = client if needs_login else anonymous_client
+
+        # warm up
+        response = request(_client)
+        status_code = response.status_code
+        response.close()
+
+        latencies = []
+        statement_counts = []
+        for _ in range(iterations):
+            statements["count"] = 0
+            start = time.perf_counter()
+            response = request(_client)
+            response.get_data()
+            latencies.append(1000 * (time.perf_counter() - start))
+            response.close()
+            statement_counts.append(statements["count"])
+
+        tracemalloc.start()
+        request(_client).close()
+        _, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        results[name] = {
+            "status_code": status_code,
+            "p50_ms": percentile(latencies, 0.50),
+            "p90_ms": percentile(latencies, 0.90),
+            "p99_ms": percentile(latencies, 0.99),
+            "sql_statements": max(statement_counts),
+            "peak_memory_kb": peak_memory / 1024,
+        }
+
+    results["_process"] = {
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+    return results
+
+
+###############################################################################
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Regressions of `results` with respect to `baseline`
+
+    A route regresses if its p50 or p90 latency or peak memory grows by
+    more than `tolerance` (a fraction), or if it runs more SQL statements.
+    """
+    regressions = []
+    for scale, scale_results in results.items():
+        for name, result in scale_results.items():
+            reference = baseline.get(scale, {}).get(name)
+            if reference is None or name.startswith("_"):
+                continue
+            for key in ["p50_ms", "p90_ms", "peak_memory_kb"]:
+                if result[key] > reference[key] * (1 + tolerance):
+                    regressions.append(
+                        f"{scale}x {name}: {key} "
+                        f"{reference[key]:.2f} -> {result[key]:.2f}"
+                    )
+            if result["sql_statements"] > reference["sql_statements"]:
+                regressions.append(
+                    f"{scale}x {name}: sql_statements "
+                    f"{reference['sql_statements']} -> {result['sql_statements']}"
+                )
+    return regressions
+
+
+def print_results(scale: int, results: dict):
+    print(f"\n## {scale}x")
+    print(
+        f"{'route':<48} {'status':>6} {'p50 ms':>9} {'p90 ms':>9} "
+        f"{'p99 ms':>9} {'sql':>6} {'peak KB':>10}"
+    )
+    for name, result in results.items():
+        if name.startswith("_"):
+            continue
+        print(
+            f"{name:<48} {result['status_code']:>6} "
+            f"{result['p50_ms']:>9.2f} {result['p90_ms']:>9.2f} "
+            f"{result['p99_ms']:>9.2f} {result['sql_statements']:>6} "
+            f"{result['peak_memory_kb']:>10.1f}"
+        )
+    print(f"max RSS: {results['_process']['max_rss_kb'] / 1024:.1f} MB")
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="API Benchmark")
+    parser.add_argument(
+        "-s", "--scales", default="1,100,10000",
+        help="Comma separated multiples of the shipped data (default: 1,100,10000)"
+    )
+    parser.add_argument(
+        "-n", "--iterations", type=int, default=50,
+        help="Requests per route (default: 50)"
+    )
+    parser.add_argument(
+        "--db-dir", default=DEFAULT_DB_DIR,
+        help=f"Directory to keep the scaled databases in (default: {DEFAULT_DB_DIR})"
+    )
+    parser.add_argument(
+        "--synthetic", action="store_true",
+        help="Build the databases with the synthetic data generator"
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true",
+        help="Rebuild the scaled databases even if they exist"
+    )
+    parser.add_argument(
+        "--baseline", default=DEFAULT_BASELINE,
+        help="Baseline results file (default: benchmarks/baseline.json)"
+    )
+    parser.add_argument(
+        "--save-baseline", action="store_true",
+        help="Save the results as the new baseline"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.25,
+        help="Allowed relative slowdown before reporting a regression (default: 0.25)"
+    )
+    args = vars(parser.parse_args())
+
+    os.makedirs(args["db_dir"], exist_ok=True)
+    context = multiprocessing.get_context("spawn")
+
+    all_results = {}
+    for _scale in map(int, args["scales"].split(",")):
+        _kind = "synthetic" if args["synthetic"] else "benchmark"
+        _db_path = os.path.join(args["db_dir"], f"{_kind}_{_scale}x.db")
+        if args["rebuild"] or not os.path.isfile(_db_path):
+            print(f"Building {_scale}x database at {_db_path} ...")
+            # not a pool worker, as the generator starts its own pool
+            _process = context.Process(
+                target=build_database,
+                args=(_db_path, _scale, args["synthetic"])
+            )
+            _process.start()
+            _process.join()
+            if _process.exitcode:
+                sys.exit(f"Could not build the {_scale}x database.")
+
+        with context.Pool(1) as pool:
+            _results = pool.apply(run_benchmark, (_db_path, args["iterations"]))
+        print_results(_scale, _results)
+        all_results[str(_scale)] = _results
+
+    if args["save_baseline"]:
+        with open(args["baseline"], "w") as f:
+            json.dump(all_results, f, indent=2)
+        print(f"\nSaved baseline to {args['baseline']}")
+    elif os.path.isfile(args["baseline"]):
+        with open(args["baseline"]) as f:
+            _baseline = json.load(f)
+        _regressions = compare(all_results, _baseline, args["tolerance"])
+        if _regressions:
+            print("\nRegressions:")
+            for _regression in _regressions:
+                print(f"  {_regression}")
+            sys.exit(1)
+        print("\nNo regressions against the baseline.")
+
+###############################################################################
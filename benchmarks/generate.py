@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic Data Generator
+
+Fills a database with synthetic but consistent data for load testing:
+tags and examples for every category in `TAG_MODEL_MAP`, dependency
+graphs (in the relation-list format parsed by `graph.js`), comments and
+change logs.
+
+Sentences are sampled from the word and sentence-length distributions of
+the shipped examples of each language, keeping the Devanagari (or native
+script) text and its ISO transliteration aligned.
+Rows are generated and bulk inserted in chunks by parallel worker
+processes.
+
+    $ python3 benchmarks/generate.py --scale 100
+    $ python3 benchmarks/generate.py --database sqlite:////tmp/big.db --scale 10000
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import sys
+import csv
+import json
+import time
+import random
+import logging
+import multiprocessing
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_SIZE = 5000
+
+GRAPHS_PER_SCALE = 100
+COMMENTS_PER_SCALE = 50
+CHANGES_PER_SCALE = 50
+
+###############################################################################
+
+
+def load_corpus(data_dir: str) -> dict:
+    """Word and sentence-length distributions of the shipped examples
+
+    Only examples whose text and ISO transliteration have the same number
+    of words are used, so that the sampled words stay aligned, and words
+    written in ASCII (annotations) are skipped.
+
+    Returns
+    -------
+    dict
+        language_id -> {"words": [(word, iso_word), ...], "lengths": [...]}
+        Words and lengths repeat as often as they occur.
+    """
+    corpus = defaultdict(lambda: {"words": [], "lengths": []})
+    for filename in sorted(os.listdir(data_dir)):
+        if not filename.endswith("_data.csv"):
+            continue
+        with open(os.path.join(data_dir, filename), encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                for example, iso in zip(
+                    (row.get("example") or "").splitlines(),
+                    (row.get("iso_transliteration") or "").splitlines()
+                ):
+                    words = example.split()
+                    iso_words = iso.split()
+                    if not words or len(words) != len(iso_words):
+                        continue
+                    language = corpus[int(row["language_id"])]
+                    # skip inline annotations such as "(simple" or "or"
+                    language["words"].extend(
+                        (word, iso_word)
+                        for word, iso_word in zip(words, iso_words)
+                        if not word.isascii()
+                    )
+                    language["lengths"].append(len(words))
+
+    everything = {"words": [], "lengths": []}
+    for language in corpus.values():
+        everything["words"].extend(language["words"])
+        everything["lengths"].extend(language["lengths"])
+    corpus[None] = everything
+    return dict(corpus)
+
+
+def generate_sentence(rng: random.Random, corpus: dict, language_id: int):
+    """(sentence, iso_transliteration) word lists in `language_id`"""
+    language = corpus.get(language_id)
+    if not language or not language["words"]:
+        language = corpus[None]
+    length = rng.choice(language["lengths"])
+    words = [rng.choice(language["words"]) for _ in range(length)]
+    return [word for word, _ in words], [iso for _, iso in words]
+
+
+def generate_dependency_graph(rng: random.Random, words: list,
+                              labels: list) -> str:
+    """Random dependency tree over `words` as `id word [label head_id]`
+    lines"""
+    root = rng.randrange(len(words))
+    attached = [root]
+    heads = {root: None}
+    for index in rng.sample(range(len(words)), len(words)):
+        if index == root:
+            continue
+        heads[index] = rng.choice(attached)
+        attached.append(index)
+
+    lines = []
+    for index, word in enumerate(words):
+        if heads[index] is None:
+            lines.append(f"{index + 1} {word}")
+        else:
+            lines.append(
+                f"{index + 1} {word} {rng.choice(labels)} {heads[index] + 1}"
+            )
+    return "\n".join(lines)
+
+
+def random_timestamp(rng: random.Random) -> datetime:
+    return datetime.utcnow() - timedelta(seconds=rng.randrange(365 * 86400))
+
+
+###############################################################################
+# Row Generators
+#
+# Every generator gets a private `random.Random`, the shared context built
+# by `build_context` and a task, and returns the rows of one chunk.
+
+
+def generate_tag_rows(rng: random.Random, context: dict, task: dict) -> list:
+    seed_tags = context["seed_tags"][task["table"]]
+    rows = []
+    for tag_id in range(task["start"], task["start"] + task["count"]):
+        row = dict(rng.choice(seed_tags))
+        row["id"] = tag_id
+        row["code"] = f"{row['code']}_{tag_id}"
+        rows.append(row)
+    return rows
+
+
+def generate_data_rows(rng: random.Random, context: dict, task: dict) -> list:
+    seed_data = context["seed_data"][task["table"]]
+    existing_tag_ids, new_start, new_count = context["tag_ids"][task["table"]]
+    tag_count = len(existing_tag_ids) + new_count
+
+    rows = []
+    for _ in range(task["count"]):
+        row = dict(rng.choice(seed_data))
+        index = rng.randrange(tag_count)
+        row["tag_id"] = (
+            existing_tag_ids[index]
+            if index < len(existing_tag_ids)
+            else new_start + index - len(existing_tag_ids)
+        )
+        words, iso_words = generate_sentence(
+            rng, context["corpus"], row["language_id"]
+        )
+        row["example"] = " ".join(words)
+        row["iso_transliteration"] = " ".join(iso_words)
+        rows.append(row)
+    return rows
+
+
+def generate_graph_rows(rng: random.Random, context: dict, task: dict) -> list:
+    language_ids = context["language_ids"]
+    rows = []
+    for index in range(task["start"], task["start"] + task["count"]):
+        language_id = language_ids[index % len(language_ids)]
+        words, iso_words = generate_sentence(rng, context["corpus"], language_id)
+        rows.append({
+            "language_id": language_id,
+            "group_id": context["group_start"] + index // len(language_ids),
+            "sentence": " ".join(words),
+            "iso_transliteration": " ".join(iso_words),
+            "gloss": " ".join(iso_words),
+            "graph": generate_dependency_graph(
+                rng, words, context["dependency_labels"]
+            ),
+            "comment": None,
+        })
+    return rows
+
+
+def generate_comment_rows(rng: random.Random, context: dict,
+                          task: dict) -> list:
+    from constants import SUGGEST_ACTION_TEXT_MAP
+
+    rows = []
+    for _ in range(task["count"]):
+        tablename = rng.choice(context["tag_tables"])
+        words, _ = generate_sentence(
+            rng, context["corpus"], rng.choice(context["language_ids"])
+        )
+        rows.append({
+            "user_id": rng.choice(context["user_ids"]),
+            "tablename": tablename,
+            "action": rng.choice(list(SUGGEST_ACTION_TEXT_MAP)),
+            "comment": " ".join(words),
+            "detail": json.dumps({
+                "tablename": tablename,
+                "row_index": rng.randrange(100),
+                "cell_index": rng.randrange(6),
+                "field_index": rng.randrange(6),
+                "field": "example",
+                "value": " ".join(words),
+                "extra": None,
+            }),
+            "timestamp": random_timestamp(rng),
+        })
+    return rows
+
+
+def generate_change_rows(rng: random.Random, context: dict,
+                         task: dict) -> list:
+    from constants import ACTION_CREATE, ACTION_EDIT, ACTION_DELETE
+
+    rows = []
+    for _ in range(task["count"]):
+        tablename = rng.choice(context["tag_tables"])
+        seed_tag = rng.choice(context["seed_tags"][tablename])
+        action = rng.choice([ACTION_CREATE, ACTION_EDIT, ACTION_DELETE])
+        if action == ACTION_EDIT:
+            detail = {
+                "description": {
+                    "old": seed_tag.get("description"),
+                    "new": " ".join(generate_sentence(
+                        rng, context["corpus"], None
+                    )[1]),
+                }
+            }
+        else:
+            detail = seed_tag
+        rows.append({
+            "user_id": rng.choice(context["user_ids"]),
+            "tablename": tablename,
+            "action": action,
+            "detail": json.dumps(detail, ensure_ascii=True),
+            "timestamp": random_timestamp(rng),
+        })
+    return rows
+
+
+GENERATORS = {
+    "tag": generate_tag_rows,
+    "data": generate_data_rows,
+    "graph": generate_graph_rows,
+    "comment": generate_comment_rows,
+    "change": generate_change_rows,
+}
+
+###############################################################################
+# Workers
+
+
+_WORKER = {}
+
+
+def init_worker(database_uri: str, context: dict):
+    from sqlalchemy import create_engine
+
+    connect_args = {}
+    if database_uri.startswith("sqlite"):
+        # parallel writers have to wait for the database lock
+        connect_args["timeout"] = 600
+    _WORKER["engine"] = create_engine(database_uri, connect_args=connect_args)
+    _WORKER["context"] = context
+
+
+def run_task(task: dict) -> int:
+    from sqlalchemy import insert
+    from models import db
+
+    rng = random.Random(task["seed"])
+    rows = GENERATORS[task["kind"]](rng, _WORKER["context"], task)
+    table = db.metadata.tables[task["table"]]
+    with _WORKER["engine"].begin() as connection:
+        connection.execute(insert(table), rows)
+    return len(rows)
+
+
+###############################################################################
+
+
+def build_context(data_dir: str) -> dict:
+    """Seed rows, valid foreign keys and text distributions shared by
+    the workers (inside an application context)"""
+    from sqlalchemy import select, func
+    from models import (
+        db, User, Language, DependencyTag, DependencyGraphData, TAG_MODEL_MAP
+    )
+
+    def seed_rows(model):
+        columns = [c for c in model.__table__.columns if c.key != "id"]
+        return [
+            dict(row._mapping)
+            for row in db.session.execute(
+                select(*columns).where(model.is_deleted == False)  # noqa
+            )
+        ]
+
+    context = {
+        "corpus": load_corpus(data_dir),
+        "language_ids": list(db.session.execute(
+            select(Language.id).where(Language.is_deleted == False)  # noqa
+        ).scalars()),
+        "user_ids": list(db.session.execute(select(User.id)).scalars()),
+        # labels are whitespace separated in the graphs, tags may contain
+        # spaces but codes do not
+        "dependency_labels": sorted(
+            code
+            for code in set(
+                db.session.execute(select(DependencyTag.code)).scalars()
+            )
+            if code and not any(c.isspace() for c in code)
+        ) or ["dep"],
+        # new groups follow the existing ones
+        "group_start": (db.session.execute(
+            select(func.max(DependencyGraphData.group_id))
+        ).scalar() or 0) + 1,
+        "tag_tables": [],
+        "seed_tags": {},
+        "seed_data": {},
+        "tag_ids": {},
+    }
+    for model_tag, model_data in TAG_MODEL_MAP.values():
+        tag_table = model_tag.__tablename__
+        context["tag_tables"].append(tag_table)
+        context["seed_tags"][tag_table] = seed_rows(model_tag)
+        context["seed_data"][model_data.__tablename__] = seed_rows(model_data)
+        context["tag_ids"][tag_table] = list(
+            db.session.execute(select(model_tag.id)).scalars()
+        )
+    return context
+
+
+def chunk_tasks(kind: str, table: str, start: int, count: int,
+                seed: int) -> list:
+    # string seeds are hashed deterministically by `random.Random`
+    return [
+        {
+            "kind": kind,
+            "table": table,
+            "start": start + offset,
+            "count": min(CHUNK_SIZE, count - offset),
+            "seed": f"{seed}:{table}:{offset}",
+        }
+        for offset in range(0, count, CHUNK_SIZE)
+    ]
+
+
+def generate(scale: int, processes: int = None, graphs: int = None,
+             comments: int = None, changes: int = None, seed: int = 0):
+    """Add synthetic rows to the database of the current application
+
+    Parameters
+    ----------
+    scale : int
+        Every tag category ends up with about `scale` times the tags and
+        examples already present.
+    processes : int, optional
+        Number of worker processes. The default is the number of CPUs.
+    graphs, comments, changes : int, optional
+        Number of dependency graphs, comments and change logs to add.
+        The defaults are proportional to `scale`.
+    seed : int, optional
+        Seed for reproducible output. The default is 0.
+
+    Returns
+    -------
+    dict
+        Number of rows added to every table
+    """
+    import settings
+    from flask import current_app
+    from models import (
+        db, Comment, ChangeLog, RowCount, DependencyGraphData, TAG_MODEL_MAP
+    )
+
+    context = build_context(settings.DATA_DIR)
+    factor = max(scale - 1, 0)
+
+    tag_tasks = []
+    data_tasks = []
+    for model_tag, model_data in TAG_MODEL_MAP.values():
+        tag_table = model_tag.__tablename__
+        data_table = model_data.__tablename__
+        existing_tag_ids = context["tag_ids"][tag_table]
+        new_tag_count = len(context["seed_tags"][tag_table]) * factor
+        new_tag_start = max(existing_tag_ids, default=0) + 1
+        context["tag_ids"][data_table] = (
+            existing_tag_ids, new_tag_start, new_tag_count
+        )
+        tag_tasks.extend(chunk_tasks(
+            "tag", tag_table, new_tag_start, new_tag_count, seed
+        ))
+        if existing_tag_ids or new_tag_count:
+            data_tasks.extend(chunk_tasks(
+                "data", data_table, 0,
+                len(context["seed_data"][data_table]) * factor, seed
+            ))
+
+    if graphs is None:
+        graphs = GRAPHS_PER_SCALE * scale
+    if comments is None:
+        comments = COMMENTS_PER_SCALE * scale
+    if changes is None:
+        changes = CHANGES_PER_SCALE * scale
+
+    if context["language_ids"]:
+        data_tasks.extend(chunk_tasks(
+            "graph", DependencyGraphData.__tablename__, 0, graphs, seed
+        ))
+    if context["user_ids"]:
+        data_tasks.extend(chunk_tasks(
+            "comment", Comment.__tablename__, 0, comments, seed
+        ))
+        data_tasks.extend(chunk_tasks(
+            "change", ChangeLog.__tablename__, 0, changes, seed
+        ))
+
+    database_uri = current_app.config["SQLALCHEMY_DATABASE_URI"]
+    db.engine.dispose()
+
+    counts = defaultdict(int)
+    multiprocessing_context = multiprocessing.get_context("spawn")
+    with multiprocessing_context.Pool(
+        processes, initializer=init_worker, initargs=(database_uri, context)
+    ) as pool:
+        # tags have to exist before examples can refer to them
+        for tasks in [tag_tasks, data_tasks]:
+            for task, count in zip(tasks, pool.imap(run_task, tasks)):
+                counts[task["table"]] += count
+                LOGGER.info(f"{task['table']}: {counts[task['table']]} rows")
+
+    # cached admin row counts are stale now
+    db.session.query(RowCount).delete()
+    db.session.commit()
+    return dict(counts)
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import settings
+
+    parser = argparse.ArgumentParser(description="Synthetic Data Generator")
+    parser.add_argument(
+        "-d", "--database", default=settings.DATABASE_URI,
+        help="Database URI (default: settings.DATABASE_URI)"
+    )
+    parser.add_argument(
+        "-s", "--scale", type=int, default=100,
+        help="Multiple of the existing tags and examples (default: 100)"
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=None,
+        help="Number of worker processes (default: number of CPUs)"
+    )
+    parser.add_argument("--graphs", type=int, help="Dependency graphs to add")
+    parser.add_argument("--comments", type=int, help="Comments to add")
+    parser.add_argument("--changes", type=int, help="Change logs to add")
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="Random seed (default: 0)"
+    )
+    args = vars(parser.parse_args())
+
+    logging.basicConfig(
+        format="[%(asctime)s] %(name)s %(levelname)s: %(message)s",
+        level=logging.INFO
+    )
+
+    # `server` creates and seeds the database on import
+    settings.DATABASE_URI = args["database"]
+    import server
+
+    with server.webapp.app_context():
+        start = time.perf_counter()
+        _counts = generate(
+            args["scale"],
+            processes=args["processes"],
+            graphs=args["graphs"],
+            comments=args["comments"],
+            changes=args["changes"],
+            seed=args["seed"],
+        )
+        elapsed = time.perf_counter() - start
+
+    for _table, _count in sorted(_counts.items()):
+        print(f"{_table:<32} {_count:>12}")
+    print(f"{sum(_counts.values())} rows in {elapsed:.1f} seconds")
+
+###############################################################################
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Login Throughput Benchmark
+
+Measures how many password checks (the dominant cost of a login) one core
+can perform per second for a password hashing method, and how that scales
+over several processes. Use it to choose `PASSWORD_HASH_METHOD` and the
+number of workers.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import sys
+import time
+import multiprocessing
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import settings  # noqa: E402
+
+###############################################################################
+
+PASSWORD = "correct horse battery staple"
+
+###############################################################################
+
+
+def count_checks(password_hash: str, duration: float) -> int:
+    """Number of successful password checks performed in `duration` seconds"""
+    count = 0
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        if check_password_hash(password_hash, PASSWORD):
+            count += 1
+    return count
+
+
+def benchmark_method(method: str, processes: int, duration: float) -> dict:
+    password_hash = generate_password_hash(
+        PASSWORD, method=method, salt_length=settings.PASSWORD_SALT_LENGTH
+    )
+    with multiprocessing.Pool(processes) as pool:
+        counts = pool.starmap(
+            count_checks, [(password_hash, duration)] * processes
+        )
+    total = sum(counts) / duration
+    return {
+        "method": method,
+        "processes": processes,
+        "logins_per_second": total,
+        "logins_per_second_per_core": total / processes,
+        "milliseconds_per_login": 1000 * processes / total if total else None,
+    }
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Login Throughput Benchmark")
+    parser.add_argument(
+        "-m", "--method", action="append",
+        help=(
+            "werkzeug password hashing method, may be repeated "
+            f"(default: {settings.PASSWORD_HASH_METHOD})"
+        )
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=os.cpu_count(),
+        help="Number of processes (default: number of cores)"
+    )
+    parser.add_argument(
+        "-d", "--duration", type=float, default=5.0,
+        help="Seconds to run each method for (default: 5)"
+    )
+    args = vars(parser.parse_args())
+
+    methods = args["method"] or [settings.PASSWORD_HASH_METHOD]
+    for _method in methods:
+        result = benchmark_method(_method, args["processes"], args["duration"])
+        _milliseconds = result["milliseconds_per_login"]
+        print(
+            f"{result['method']}: "
+            f"{result['logins_per_second']:.1f} logins/s with "
+            f"{result['processes']} processes, "
+            f"{result['logins_per_second_per_core']:.1f} logins/s per core "
+            + (
+                f"({_milliseconds:.1f} ms per login)"
+                if _milliseconds is not None
+                else "(no login completed)"
+            )
+        )
+
+###############################################################################
@@ -10,6 +10,7 @@ Models
 
 import os
 import sqlite3
+import functools
 from datetime import datetime as dt
 
 from sqlalchemy import (
@@ -19,11 +20,13 @@ from sqlalchemy import (
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy.engine import Engine
 
-from flask import url_for
+from flask import url_for, request
 from flask_login import UserMixin
 from flask_sqlalchemy import SQLAlchemy
 from werkzeug.security import generate_password_hash
 
+from settings import PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH
+from utils.cache import BIBTEX_CACHE
 from constants import ROLE_ADMIN, ROLE_CURATOR, ROLE_USER
 from constants import ACTION_CREATE, ACTION_EDIT, ACTION_DELETE
 from constants import SUGGEST_GENERIC, SUGGEST_CREATE, SUGGEST_EDIT, SUGGEST_DELETE
@@ -70,9 +73,54 @@ class User(UserMixin, db.Model):
 @event.listens_for(User.password, 'set', retval=True)
 def hash_user_password(target, value, old_value, initiator):
     if value != old_value:
-        return generate_password_hash(value)
+        return generate_password_hash(
+            value,
+            method=PASSWORD_HASH_METHOD,
+            salt_length=PASSWORD_SALT_LENGTH
+        )
     return value
 
+
+@functools.lru_cache(maxsize=1)
+def get_password_hash_method() -> str:
+    """Method prefix of the hashes made with `PASSWORD_HASH_METHOD`
+
+    werkzeug fills in the default parameters of a method (e.g. "scrypt"
+    becomes "scrypt:32768:8:1"), so the prefix is taken from a hash made
+    with it, instead of comparing with the setting as it is written.
+    """
+    return generate_password_hash(
+        "", method=PASSWORD_HASH_METHOD, salt_length=1
+    ).partition("$")[0]
+
+
+def password_needs_rehash(password_hash: str) -> bool:
+    """Check if a password hash was made with other hashing parameters"""
+    method, _, rest = password_hash.partition("$")
+    salt, _, _ = rest.partition("$")
+    return (
+        method != get_password_hash_method()
+        or len(salt) != PASSWORD_SALT_LENGTH
+    )
+
+
+class CachedUser(UserMixin):
+    """Detached copy of the `User` fields needed by `current_user`"""
+
+    def __init__(self, id, username, role, is_deleted):
+        self.id = id
+        self.username = username
+        self.role = role
+        self.is_deleted = is_deleted
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.role, user.is_deleted)
+
+    def __str__(self):
+        class_name = self.__class__.__qualname__
+        return f"<{class_name} {self.id}: {self.username}>"
+
 ###############################################################################
 
 
@@ -121,6 +169,26 @@ class ChangeLog(db.Model):
     user = relationship(User.__qualname__, backref=backref('changes'))
 
 
+###############################################################################
+# Row Count
+
+
+class RowCount(db.Model):
+    tablename = Column(String(255), primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+    timestamp = Column(DateTime, default=dt.utcnow)
+
+
+###############################################################################
+# Data Version
+
+
+class DataVersion(db.Model):
+    name = Column(String(255), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    timestamp = Column(DateTime, default=dt.utcnow, onupdate=dt.utcnow)
+
+
 ###############################################################################
 
 
@@ -432,7 +500,9 @@ TAG_SCHEMA = {
         },
     },
     MorphologyTag.__tablename__: {
-        "meta": {},
+        "meta": {
+            "type": "Type"
+        },
         "data": {
             "iso_transliteration": "ISO Transliteration",
         },
@@ -448,6 +518,7 @@ TAG_SCHEMA = {
     TenseAspectMoodTag.__tablename__: {
         "meta": {
             "tag": "TAM Tag",
+            "type": "Type",
             "sanskrit_lakara": "Sanskrit Lakāra",
             "tense_tag": "Tense Tag (K)",
             "aspect_tag": "Aspect Tag (P)",
@@ -464,7 +535,10 @@ TAG_SCHEMA = {
         }
     },
     DependencyTag.__tablename__: {
-        "meta": {},
+        "meta": {
+            "existing_tag": "Existing Tag",
+            "intrasentence_relation": "Intra-sentence Relation"
+        },
         "data": {
             "iso_transliteration": "ISO Transliteration",
         },
@@ -497,6 +571,22 @@ class Publication(db.Model):
 
     @property
     def bibtex(self):
+        # Rendered entries are cached per publication, along with the
+        # content (and URL root) they were rendered from
+        content_key = (
+            self.title, self.author, self.year, self.booktitle,
+            self.publisher, self.address, self.url, self.bibtex_key,
+            self.filename, request.url_root if request else None
+        )
+        cached = BIBTEX_CACHE.get(self.id)
+        if cached is not None and cached[0] == content_key:
+            return cached[1]
+
+        bibtex_entry = self.render_bibtex()
+        BIBTEX_CACHE.set(self.id, (content_key, bibtex_entry))
+        return bibtex_entry
+
+    def render_bibtex(self):
         # Generate a BibTeX key if not provided
         bibtex_key = self.bibtex_key
         if not bibtex_key:
@@ -6,25 +6,44 @@ Flask-Admin Models
 @author: Hrishikesh Terdalkar
 """
 
+import io
 import os
+import csv
 import json
 import shutil
+import tempfile
 
 from sqlalchemy import func
 
-from flask import request, flash, redirect, url_for, current_app
+from flask import (request, flash, redirect, url_for, current_app,
+                   Response, send_file, stream_with_context)
 from flask_login import current_user
 
-from flask_admin import AdminIndexView
+from flask_admin import AdminIndexView, expose
 from flask_admin.contrib.sqla import ModelView
 from flask_admin.babel import gettext
+from flask_admin.helpers import get_redirect_target
+from flask_admin._compat import csv_encode
 
 from flask_admin.form import FileUploadField
-from flask_wtf.file import FileRequired, FileStorage
+from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileAllowed, FileRequired, FileStorage
+from wtforms import SelectField
 from werkzeug.utils import secure_filename
 
-from settings import UPLOAD_DIR
+try:
+    import xlsxwriter
+except ImportError:
+    xlsxwriter = None
+
+from settings import UPLOAD_DIR, EXPORT_YIELD_PER, ADMIN_APPROXIMATE_COUNT
 from models import ChangeLog
+from utils.database import (
+    bulk_import_rows, bump_data_version,
+    get_row_count, adjust_row_count, get_approximate_row_count,
+)
+from utils.cache import USER_CACHE, PAGE_CACHE, BIBTEX_CACHE, PAGES_VERSION
+from utils.tagset import TAGSET
 from constants import ROLE_USER, ROLE_CURATOR, ROLE_ADMIN
 from constants import ACTION_CREATE, ACTION_EDIT, ACTION_DELETE
 
@@ -62,7 +81,178 @@ class SecureModelView(ModelView):
 ###############################################################################
 
 
-class ReadOnlyModelView(SecureModelView):
+class RowCountQuery:
+    """Stand-in for a count query whose result is already known"""
+    def __init__(self, count):
+        self.count = count
+
+    def scalar(self):
+        return self.count
+
+
+class CachedCountModelView(SecureModelView):
+    """Serve list view counts without scanning the table on every page
+
+    If `count_cached` is set, unfiltered counts are read from the `RowCount`
+    table, which is kept current by the create / delete hooks and
+    reconciled periodically. If `settings.ADMIN_APPROXIMATE_COUNT` is set,
+    unfiltered counts are estimated from the largest id instead.
+    Searches and filters always use an exact count.
+    """
+
+    # custom options
+    count_cached = False
+
+    def get_exact_count_query(self):
+        return super().get_count_query()
+
+    def get_count_query(self):
+        view_args = self._get_list_extra_args()
+        if view_args.search or view_args.filters:
+            return self.get_exact_count_query()
+
+        if ADMIN_APPROXIMATE_COUNT:
+            return RowCountQuery(get_approximate_row_count(self.model))
+        if self.count_cached:
+            return RowCountQuery(
+                get_row_count(self.model, self.get_exact_count_query())
+            )
+        return self.get_exact_count_query()
+
+
+###############################################################################
+
+
+class StreamingExportModelView(SecureModelView):
+    """Export rows as they are fetched instead of loading the whole table
+
+    csv, tsv and json exports are streamed row by row from a query that
+    fetches `EXPORT_YIELD_PER` rows at a time, and xlsx exports are written
+    in the constant-memory mode of `xlsxwriter`.
+    """
+    export_types = ("csv", "tsv", "json", "xlsx")
+
+    def _export_data(self):
+        view_args = self._get_list_extra_args()
+
+        sort_column = self._get_column_by_idx(view_args.sort)
+        if sort_column is not None:
+            sort_column = sort_column[0]
+
+        _, query = self.get_list(
+            0, sort_column, view_args.sort_desc,
+            view_args.search, view_args.filters,
+            execute=False, page_size=self.export_max_rows
+        )
+        return None, query.yield_per(EXPORT_YIELD_PER)
+
+    def _export_rows(self):
+        _, data = self._export_data()
+        for row in data:
+            yield [
+                csv_encode(self.get_export_value(row, column))
+                for column, _ in self._export_columns
+            ]
+
+    def _export_response(self, generator, export_type, mimetype):
+        filename = secure_filename(self.get_export_name(export_type))
+        return Response(
+            stream_with_context(generator),
+            headers={"Content-Disposition": f"attachment;filename={filename}"},
+            mimetype=mimetype
+        )
+
+    @expose("/export/<export_type>/")
+    def export(self, export_type):
+        return_url = get_redirect_target() or self.get_url(".index_view")
+
+        if not self.can_export or (export_type not in self.export_types):
+            flash(gettext("Permission denied."), "error")
+            return redirect(return_url)
+
+        if export_type in ["csv", "tsv"]:
+            return self._export_delimited(export_type)
+        if export_type == "json":
+            return self._export_json()
+        if export_type == "xlsx":
+            return self._export_xlsx(return_url)
+        return super().export(export_type)
+
+    def _export_delimited(self, export_type):
+        class Echo:
+            def write(self, value):
+                return value
+
+        delimiter = "\t" if export_type == "tsv" else ","
+        writer = csv.writer(Echo(), delimiter=delimiter)
+        titles = [csv_encode(title) for _, title in self._export_columns]
+
+        def generate():
+            yield writer.writerow(titles)
+            for values in self._export_rows():
+                yield writer.writerow(values)
+
+        mimetype = (
+            "text/tab-separated-values"
+            if export_type == "tsv"
+            else "text/csv"
+        )
+        return self._export_response(generate(), export_type, mimetype)
+
+    def _export_json(self):
+        titles = [csv_encode(title) for _, title in self._export_columns]
+
+        def generate():
+            separator = "["
+            for values in self._export_rows():
+                yield separator + json.dumps(
+                    dict(zip(titles, values)), ensure_ascii=False, default=str
+                )
+                separator = ",\n"
+            yield "[]" if separator == "[" else "]"
+
+        return self._export_response(
+            generate(), "json", "application/json"
+        )
+
+    def _export_xlsx(self, return_url):
+        if xlsxwriter is None:
+            flash("XlsxWriter dependency not installed.", "error")
+            return redirect(return_url)
+
+        titles = [csv_encode(title) for _, title in self._export_columns]
+
+        fd, filepath = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            workbook = xlsxwriter.Workbook(
+                filepath, {"constant_memory": True, "strings_to_urls": False}
+            )
+            worksheet = workbook.add_worksheet()
+            worksheet.write_row(0, 0, titles)
+            for row_index, values in enumerate(self._export_rows(), start=1):
+                worksheet.write_row(row_index, 0, values)
+            workbook.close()
+            # file is removed from disk once the open handle is released
+            xlsx_file = open(filepath, "rb")
+        finally:
+            os.remove(filepath)
+
+        return send_file(
+            xlsx_file,
+            mimetype=(
+                "application/vnd.openxmlformats-officedocument"
+                ".spreadsheetml.sheet"
+            ),
+            as_attachment=True,
+            download_name=secure_filename(self.get_export_name("xlsx"))
+        )
+
+
+###############################################################################
+
+
+class ReadOnlyModelView(StreamingExportModelView, CachedCountModelView):
     column_display_pk = True
     can_set_page_size = True
 
@@ -71,7 +261,6 @@ class ReadOnlyModelView(SecureModelView):
     can_delete = False
 
     can_export = True
-    export_types = ("csv", "tsv", "json", "xlsx")
 
 
 class AdminOnlyModelView(SecureModelView):
@@ -84,7 +273,29 @@ class AdminOnlyModelView(SecureModelView):
 ###############################################################################
 
 
-class BaseModelView(SecureModelView):
+class BulkImportForm(FlaskForm):
+    file = FileField(
+        "File",
+        validators=[
+            FileRequired(),
+            FileAllowed(["csv", "tsv", "txt"], "CSV or TSV files only.")
+        ]
+    )
+    delimiter = SelectField(
+        "Format",
+        choices=[
+            ("auto", "Detect from extension"),
+            (",", "CSV (comma separated)"),
+            ("\t", "TSV (tab separated)"),
+        ],
+        default="auto"
+    )
+
+
+###############################################################################
+
+
+class BaseModelView(StreamingExportModelView, CachedCountModelView):
     column_display_pk = True
 
     can_export = True
@@ -98,17 +309,22 @@ class BaseModelView(SecureModelView):
     details_modal = True
 
     can_set_page_size = True
-    export_types = ("csv", "tsv", "json", "xlsx")
     column_exclude_list = ("is_deleted",)
     column_details_exclude_list = ("is_deleted",)
 
+    list_template = "admin/model/list_import.html"
+
     # custom options
     exclude_relationships = False
+    can_import = False
+    count_cached = True
+    # changes are part of the in-memory tagset
+    affects_tagset = False
 
     def get_query(self):
         return self.session.query(self.model).filter(self.model.is_deleted == False)  # noqa
 
-    def get_count_query(self):
+    def get_exact_count_query(self):
         return self.session.query(func.count('*')).select_from(self.model).filter(self.model.is_deleted == False)  # noqa
 
     def delete_model(self, model):
@@ -117,7 +333,6 @@ class BaseModelView(SecureModelView):
             model.is_deleted = True
             self.session.add(model)
             self.session.commit()
-            self.after_model_delete(model)
         except Exception as ex:
             if not self.handle_view_exception(ex):
                 flash(
@@ -177,6 +392,70 @@ class BaseModelView(SecureModelView):
         self.session.add(change_log)
         # commit is performed in parent action
 
+    def after_model_change(self, form, model, is_created):
+        if is_created:
+            adjust_row_count(self.model, 1)
+        if self.affects_tagset:
+            TAGSET.bump()
+
+    def after_model_delete(self, model):
+        adjust_row_count(self.model, -1)
+        if self.affects_tagset:
+            TAGSET.bump()
+
+    @expose("/import/", methods=("GET", "POST"))
+    def import_view(self):
+        return_url = get_redirect_target() or self.get_url(".index_view")
+
+        if not (self.can_import and self.can_create):
+            return redirect(return_url)
+
+        form = BulkImportForm()
+        report = None
+        if form.validate_on_submit():
+            upload = form.file.data
+            delimiter = form.delimiter.data
+            if delimiter == "auto":
+                delimiter = (
+                    "\t"
+                    if upload.filename.lower().endswith(".tsv")
+                    else ","
+                )
+
+            stream = io.TextIOWrapper(
+                upload.stream, encoding="utf-8-sig", newline=""
+            )
+            reader = csv.DictReader(stream, delimiter=delimiter)
+            unknown_columns = [
+                column
+                for column in (reader.fieldnames or [])
+                if column not in self.model.__table__.columns
+            ]
+            report = bulk_import_rows(
+                self.model,
+                reader,
+                user_id=current_user.id,
+                detail={"filename": secure_filename(upload.filename)}
+            )
+            report["unknown_columns"] = unknown_columns
+            if report["inserted"] and self.affects_tagset:
+                TAGSET.bump()
+
+            if report["inserted"]:
+                flash(
+                    f"Imported {report['inserted']} of {report['total']} rows.",
+                    "success"
+                )
+            else:
+                flash("No rows were imported.", "error")
+
+        return self.render(
+            "admin/model/import.html",
+            form=form,
+            report=report,
+            return_url=return_url
+        )
+
     def __init__(self, model, session, **kwargs):
         if self.form_excluded_columns:
             self.form_excluded_columns = list(self.form_excluded_columns)
@@ -274,9 +553,25 @@ class PublicationAdminView(BaseAdminModelView):
                 # Rename the file on disk
                 shutil.move(filepath_old, filepath_new)
 
+        BIBTEX_CACHE.pop(model.id)
+
         # Call the parent method to handle logging and other operations
         super().on_model_change(form, model, is_created)
 
+    def after_model_change(self, form, model, is_created):
+        PAGE_CACHE.clear()
+        bump_data_version(PAGES_VERSION)
+        super().after_model_change(form, model, is_created)
+
+    def on_model_delete(self, model):
+        BIBTEX_CACHE.pop(model.id)
+        super().on_model_delete(model)
+
+    def after_model_delete(self, model):
+        PAGE_CACHE.clear()
+        bump_data_version(PAGES_VERSION)
+        super().after_model_delete(model)
+
 ###############################################################################
 
 
@@ -300,12 +595,21 @@ class UserModelView(BaseAdminModelView, AdminOnlyModelView):
     # custom options
     exclude_relationships = True
 
+    def after_model_change(self, form, model, is_created):
+        USER_CACHE.pop(str(model.id))
+        super().after_model_change(form, model, is_created)
+
+    def after_model_delete(self, model):
+        USER_CACHE.pop(str(model.id))
+        super().after_model_delete(model)
+
 
 class LanguageModelView(BaseAdminModelView):
     column_searchable_list = ("code", "name", "english_name")
 
     # custom options
     exclude_relationships = True
+    affects_tagset = True
 
 ###############################################################################
 
@@ -319,6 +623,9 @@ class TagInformationModelView(BaseAdminModelView, AdminOnlyModelView):
 
     column_searchable_list = ("tablename", "name", "english_name")
 
+    # custom options
+    affects_tagset = True
+
 
 ###############################################################################
 
@@ -334,6 +641,8 @@ class TagModelView(BaseModelView):
 
     # custom options
     exclude_relationships = True
+    can_import = True
+    affects_tagset = True
 
 
 class DataModelView(BaseModelView):
@@ -344,6 +653,10 @@ class DataModelView(BaseModelView):
         "english_translation",
     )
 
+    # custom options
+    can_import = True
+    affects_tagset = True
+
 
 class GraphModelView(BaseModelView):
     column_searchable_list = (
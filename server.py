@@ -8,13 +8,21 @@ Linguistic Tag Viewer
 
 ###############################################################################
 
+import gc
+import io
+import json
 import os
 import csv
+import time
 import logging
 import datetime
+import functools
+import mimetypes
+from urllib.parse import quote
 
 from flask import (Flask, render_template, redirect, jsonify, url_for,
-                   request, flash, session, Response, abort)
+                   request, flash, session, Response, abort,
+                   stream_with_context)
 from flask import send_from_directory
 from flask_login import (
     LoginManager,
@@ -26,16 +34,17 @@ from flask_login import (
 from flask_admin import Admin, helpers as admin_helpers
 
 from sqlalchemy import or_, and_, func
-from werkzeug.security import check_password_hash
+from werkzeug.security import check_password_hash, safe_join
 
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 
 from flask_wtf import CSRFProtect
+from flask_wtf.csrf import generate_csrf
 
 # local
 from models import (
-    db, User, Language, ChangeLog,
+    db, User, CachedUser, Language, ChangeLog, password_needs_rehash,
     SentenceMeaningTag, SentenceMeaningData,
     SentenceStructureTag, SentenceStructureData,
     VoiceTag, VoiceData,
@@ -49,7 +58,7 @@ from models import (
     TagInformation,
     Comment,
     Publication,
-    TAG_MODEL_MAP, TAG_SCHEMA, GRAPH_MODEL_MAP
+    GRAPH_MODEL_MAP
 )
 from models_admin import (
     SecureAdminIndexView, UserModelView, LanguageModelView,
@@ -63,7 +72,24 @@ from models_admin import (
 import settings
 import constants
 from utils.reverseproxied import ReverseProxied
-from utils.database import create_user, model_to_dict
+from utils.compression import Compressed
+from utils.assets import StaticAssets
+from utils.instrumentation import SQLInstrumentation
+from utils.database import create_users, get_data_version
+from utils.cache import USER_CACHE, PAGE_CACHE, BIBTEX_CACHE, PAGES_VERSION
+from utils.tagset import TAGSET
+from utils.validation import (
+    FORMATS, Validator, get_vocabularies, parse_columns
+)
+from utils.facets import (
+    get_facet_indexes, compose_tam, decompose_tam, TAM_CATEGORY, TAM_PARTS
+)
+from utils.metrics import Metrics
+from utils.ratelimit import SQLiteStorage  # noqa: registers sqlite://
+
+###############################################################################
+
+startup_start = time.perf_counter()
 
 ###############################################################################
 
@@ -76,6 +102,16 @@ logging.basicConfig(format='[%(asctime)s] %(name)s %(levelname)s: %(message)s',
 ###############################################################################
 
 webapp = Flask(settings.APP_NAME, static_folder=settings.STATIC_DIR)
+compressed = None
+if settings.COMPRESS_RESPONSES:
+    compressed = Compressed(
+        webapp.wsgi_app,
+        min_size=settings.COMPRESS_MIN_SIZE,
+        level=settings.COMPRESS_LEVEL,
+        cache_size=settings.COMPRESS_CACHE_SIZE,
+        cache_bytes=settings.COMPRESS_CACHE_BYTES,
+    )
+    webapp.wsgi_app = compressed
 webapp.wsgi_app = ReverseProxied(webapp.wsgi_app)
 webapp.url_map.strict_slashes = False
 
@@ -106,6 +142,30 @@ webapp.config['WTF_CSRF_TIME_LIMIT'] = None
 
 db.init_app(webapp)
 
+# fingerprinted static assets
+static_assets = StaticAssets(webapp)
+
+# per-request sql statement count and time (also used by metrics)
+sql_instrumentation = (
+    SQLInstrumentation(
+        webapp,
+        slow_query_threshold=settings.SQL_SLOW_QUERY_THRESHOLD,
+        headers=settings.SQL_INSTRUMENTATION
+    )
+    if settings.SQL_INSTRUMENTATION or settings.METRICS_ENABLED
+    else None
+)
+
+# prometheus metrics
+metrics = None
+if settings.METRICS_ENABLED:
+    metrics = Metrics(webapp, caches={
+        "user": USER_CACHE,
+        "page": PAGE_CACHE,
+        "bibtex": BIBTEX_CACHE,
+        **({"compression": compressed.cache} if compressed else {}),
+    })
+
 # flask-login
 login_manager = LoginManager()
 login_manager.init_app(webapp)
@@ -114,9 +174,12 @@ csrf = CSRFProtect(webapp)
 limiter = Limiter(
     key_func=get_remote_address,
     app=webapp,
-    default_limits=["1800 per hour"],
-    storage_uri="memory://",
+    default_limits=[settings.RATE_LIMIT_DEFAULT],
+    storage_uri=settings.RATE_LIMIT_STORAGE_URI,
+    strategy=settings.RATE_LIMIT_STRATEGY,
 )
+if "metrics" in webapp.view_functions:
+    limiter.exempt(webapp.view_functions["metrics"])
 
 # flask-admin
 admin = Admin(
@@ -164,7 +227,14 @@ admin.add_view(CommentModelView(Comment, db.session))
 
 @login_manager.user_loader
 def load_user(user_id):
-    return db.session.get(User, user_id)
+    user = USER_CACHE.get(user_id)
+    if user is None:
+        _user = db.session.get(User, user_id)
+        if _user is None:
+            return None
+        user = CachedUser.from_user(_user)
+        USER_CACHE.set(user_id, user)
+    return user
 
 
 @login_manager.unauthorized_handler
@@ -189,8 +259,7 @@ def unauthorized_handler():
 # def init_database():
 with webapp.app_context():
     db.create_all()
-    for user in settings.USERS:
-        create_user(user["username"], user["password"], user["role"])
+    create_users(settings.USERS)
 
     data_tables = [
         Language,
@@ -223,59 +292,146 @@ with webapp.app_context():
             )
         db.session.commit()
 
+    # warm-up: built before the workers are forked (e.g. gunicorn --preload)
+    # so that they share it; frozen objects are not touched by the garbage
+    # collector. Every worker then polls for changes made by the others.
+    TAGSET.init_app(webapp, poll_interval=settings.TAGSET_POLL_INTERVAL)
+    TAGSET.load()
+    gc.freeze()
+
+if metrics is not None:
+    metrics.set_startup_duration(time.perf_counter() - startup_start)
+
 
 ###############################################################################
 
 
+GLOBAL_CONTEXT = {
+    "title": settings.APP_TITLE,
+    "header": settings.APP_HEADER,
+    "since": settings.APP_SINCE,
+    "copyright": settings.APP_COPYRIGHT,
+    "navigation_menu": settings.NAVIGATION,
+    "footer_links": settings.FOOTER_LINKS,
+    "roles": {
+        "ROLE_ADMIN": constants.ROLE_ADMIN,
+        "ROLE_CURATOR": constants.ROLE_CURATOR,
+        "ROLE_USER": constants.ROLE_USER
+    },
+    "comment": {
+        "actions": constants.SUGGEST_ACTION_TEXT_MAP
+    }
+}
+
+
 @webapp.context_processor
 def insert_global_context():
-    return {
-        "now": datetime.datetime.now(),
-        "title": settings.APP_TITLE,
-        "header": settings.APP_HEADER,
-        "since": settings.APP_SINCE,
-        "copyright": settings.APP_COPYRIGHT,
-        "navigation_menu": settings.NAVIGATION,
-        "footer_links": settings.FOOTER_LINKS,
-        "roles": {
-            "ROLE_ADMIN": constants.ROLE_ADMIN,
-            "ROLE_CURATOR": constants.ROLE_CURATOR,
-            "ROLE_USER": constants.ROLE_USER
-        },
-        "comment": {
-            "actions": constants.SUGGEST_ACTION_TEXT_MAP
-        }
-    }
+    return dict(GLOBAL_CONTEXT, now=datetime.datetime.now())
+
+
+###############################################################################
+# Page Cache
+
+CSRF_PLACEHOLDER = "\x00csrf-token\x00"
+
+# last `PAGES_VERSION` seen by this worker and when it was checked
+PAGE_CACHE_STATE = {"version": None, "checked": None}
+
+
+def check_pages_version():
+    """Clear `PAGE_CACHE` if the pages were changed by any worker
+
+    The version is read from the database at most once every
+    `PAGE_CACHE_POLL_INTERVAL` seconds.
+    """
+    now = time.monotonic()
+    checked = PAGE_CACHE_STATE["checked"]
+    if (
+        checked is not None
+        and now - checked < settings.PAGE_CACHE_POLL_INTERVAL
+    ):
+        return
+    PAGE_CACHE_STATE["checked"] = now
+    version = get_data_version(PAGES_VERSION)
+    if version != PAGE_CACHE_STATE["version"]:
+        PAGE_CACHE.clear()
+        PAGE_CACHE_STATE["version"] = version
+
+
+def cached_page(view):
+    """Serve a rendered page from `PAGE_CACHE`
+
+    Pages are cached per endpoint and host, separately for anonymous users
+    and for each logged in user. The CSRF token of the request that
+    rendered the page is replaced by that of the current request when the
+    page is served. Requests with pending flash messages are not cached.
+    Pages changed by any worker are dropped, see `check_pages_version()`.
+    """
+    @functools.wraps(view)
+    def decorated_view(*args, **kwargs):
+        if "_flashes" in session:
+            return view(*args, **kwargs)
+
+        check_pages_version()
+
+        key = (
+            request.endpoint,
+            request.host_url,
+            current_user.is_authenticated,
+            getattr(current_user, "role", None),
+            getattr(current_user, "id", None),
+        )
+        page = PAGE_CACHE.get(key)
+        if page is None:
+            response = webapp.make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+            page = (
+                response.get_data(as_text=True).replace(
+                    generate_csrf(), CSRF_PLACEHOLDER
+                ),
+                response.mimetype
+            )
+            PAGE_CACHE.set(key, page)
+
+        content, mimetype = page
+        return Response(
+            content.replace(CSRF_PLACEHOLDER, generate_csrf()),
+            mimetype=mimetype
+        )
+
+    return decorated_view
 
 
 ###############################################################################
 # API
 
+# columns of the examples that are not shown in the comparison grid
+PIVOT_IGNORE_FIELDS = {"id", "tag_id", "language_id", "is_deleted"}
+
 
 @webapp.route("/api/list/languages", methods=["GET"])
 def list_languages():
+    tagset = TAGSET.get()
     response = {
-        language.id: model_to_dict(language)
-        for language in Language.query.filter(
-            Language.is_deleted == False  # noqa
-        ).all()
+        language.id: language.to_dict()
+        for language in tagset.languages
     }
     return jsonify(response)
 
 
 @webapp.route("/api/list/tags", methods=["GET"])
 def list_tags():
+    tagset = TAGSET.get()
     response = []
-    for category in TagInformation.query.filter(TagInformation.is_visible == True).all():
-        _model_tag, _model_data = TAG_MODEL_MAP[category.tablename]
+    for category in tagset.tag_information:
+        _category = tagset.categories.get(category.tablename)
         response.append({
             "tablename": category.tablename,
             "name": category.name,
             "english_name": category.english_name,
             "level": category.level,
-            "count": _model_tag.query.filter(
-                _model_tag.is_deleted == False  # noqa
-            ).count() if _model_tag is not None else 0
+            "count": len(_category.tags) if _category is not None else 0
         })
 
     return jsonify(response)
@@ -284,46 +440,31 @@ def list_tags():
 @webapp.route("/api/list/<string:tag_category>", methods=["GET"])
 @login_required
 def list_category_tags(tag_category: str):
-    model_tag, model_data = TAG_MODEL_MAP[tag_category]
-    response = [
-        model_to_dict(model)
-        for model in model_tag.query.filter(
-            model_tag.is_deleted == False  # noqa
-        ).order_by(model_tag.code).all()
-    ]
+    category = TAGSET.get().categories[tag_category]
+    response = [tag.to_dict() for tag in category.tags]
     return jsonify(response)
 
 
 @webapp.route("/api/get/<string:tag_category>/<string:tag_ids>", methods=["GET"])
 @login_required
 def get_category_tags(tag_category: str, tag_ids: str = None):
-    model_tag, model_data = TAG_MODEL_MAP[tag_category]
-    tag_ids = tag_ids.split(",")[:4]
-    tags = model_tag.query.filter(
-        model_tag.id.in_(tag_ids),
-        model_tag.is_deleted == False  # noqa
-    ).order_by(model_tag.code).all()
-    if tags is None:
-        return jsonify({})
+    tagset = TAGSET.get()
+    category = tagset.categories[tag_category]
+    try:
+        tags = category.get_tags(tag_ids.split(",")[:settings.MAX_SELECT])
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
 
     response = {
         "languages": {
-            language.id: model_to_dict(language)
-            for language in Language.query.filter(
-                Language.is_deleted == False  # noqa
-            ).all()
+            language.id: language.to_dict()
+            for language in tagset.languages
         },
-        "schema": TAG_SCHEMA[tag_category],
+        "schema": category.schema,
         "tags": [
             {
-                "tag": model_to_dict(tag),
-                "data": [
-                    model_to_dict(row)
-                    for row in model_data.query.filter(
-                        model_data.tag_id == tag.id,
-                        model_data.is_deleted == False  # noqa
-                    ).all()
-                ]
+                "tag": tag.to_dict(),
+                "data": [row.to_dict() for row in category.get_data(tag.id)]
             }
             for tag in tags
         ]
@@ -332,6 +473,118 @@ def get_category_tags(tag_category: str, tag_ids: str = None):
 
 
 
+@webapp.route("/api/facets", methods=["GET"])
+@login_required
+def list_facets():
+    """Facet fields (from `TAG_SCHEMA`) and value counts of every category"""
+    response = {
+        name: index.search({}, tags=False)
+        for name, index in get_facet_indexes(TAGSET.get()).items()
+    }
+    return jsonify(response)
+
+
+@webapp.route("/api/facets/<string:tag_category>", methods=["GET"])
+@login_required
+def search_category_facets(tag_category: str):
+    """Tags matching `?field=value` filters, with counts per facet value
+
+    Values of a repeated field are combined with OR, fields with AND.
+    """
+    index = get_facet_indexes(TAGSET.get()).get(tag_category)
+    if index is None:
+        abort(404)
+    filters = request.args.to_dict(flat=False)
+    unknown = set(filters) - set(index.fields)
+    if unknown:
+        return jsonify({
+            "message": f"Unknown fields: {', '.join(sorted(unknown))}"
+        }), 400
+    return jsonify(index.search(filters))
+
+
+@webapp.route("/api/tam/compose", methods=["GET"])
+@login_required
+def compose_tam_tag():
+    index = get_facet_indexes(TAGSET.get())[TAM_CATEGORY]
+    parts = {
+        field: [
+            value.strip()
+            for values in request.args.getlist(field)
+            for value in values.split(",") if value.strip()
+        ]
+        for field in TAM_PARTS
+    }
+    return jsonify(compose_tam(index, parts))
+
+
+@webapp.route("/api/tam/decompose/<path:tag>", methods=["GET"])
+@login_required
+def decompose_tam_tag(tag: str):
+    index = get_facet_indexes(TAGSET.get())[TAM_CATEGORY]
+    response = decompose_tam(index, tag)
+    if response is None:
+        abort(404)
+    return jsonify(response)
+
+
+@webapp.route("/api/pivot/<string:tag_category>/<string:tag_ids>", methods=["GET"])
+@login_required
+def get_category_pivot(tag_category: str, tag_ids: str):
+    """Examples of the selected tags as a grid
+
+    There is a column for every (language, tag) pair, languages first,
+    and a row of aligned values for every field of the examples.
+    """
+    tagset = TAGSET.get()
+    category = tagset.categories[tag_category]
+    try:
+        tags = category.get_tags(tag_ids.split(",")[:settings.MAX_SELECT])
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    columns = [
+        (language.id, tag.id)
+        for language in tagset.languages
+        for tag in tags
+    ]
+    positions = {column: position for position, column in enumerate(columns)}
+    values = {}
+    for tag in tags:
+        for row in category.get_data(tag.id):
+            position = positions.get((row.language_id, tag.id))
+            if position is None:
+                continue
+            for field in row._fields:
+                if field in PIVOT_IGNORE_FIELDS:
+                    continue
+                if field not in values:
+                    values[field] = [None] * len(columns)
+                values[field][position] = getattr(row, field)
+
+    response = {
+        "languages": {
+            language.id: language.to_dict()
+            for language in tagset.languages
+        },
+        "schema": category.schema,
+        "tags": [tag.to_dict() for tag in tags],
+        "columns": [
+            {"language_id": language_id, "tag_id": tag_id}
+            for language_id, tag_id in columns
+        ],
+        "rows": [
+            {
+                "field": field,
+                "title": category.schema["data"].get(field),
+                "values": field_values
+            }
+            for field, field_values in values.items()
+        ]
+    }
+    return jsonify(response)
+
+
 @webapp.route("/api/graph/get/<string:graph_category>/", methods=["GET"])
 @webapp.route("/api/graph/get/<string:graph_category>/<string:language_id>", methods=["GET"])
 @login_required
@@ -345,10 +598,8 @@ def get_category_graphs(graph_category: str, language_id: int = None):
 
     response = {
         "languages": {
-            language.id: model_to_dict(language)
-            for language in Language.query.filter(
-                Language.is_deleted == False  # noqa
-            ).all()
+            language.id: language.to_dict()
+            for language in TAGSET.get().languages
         },
         "graphs": [
             {
@@ -395,6 +646,59 @@ def post_comment():
         response["style"] = "danger"
     return jsonify(response)
 
+
+@webapp.route("/api/debug/sql", methods=["GET"])
+@login_required
+def show_sql_instrumentation():
+    if sql_instrumentation is None:
+        abort(404)
+    if current_user.role != constants.ROLE_ADMIN:
+        abort(403)
+    return jsonify(sql_instrumentation.summary())
+
+
+@webapp.route("/api/validate/<string:corpus_format>", methods=["POST"])
+@csrf.exempt
+@login_required
+def validate_corpus(corpus_format: str):
+    """Validate the tags of a CoNLL-U or TSV corpus (the request body)
+
+    Columns to check are given as `?column=COLUMN=CATEGORY` (repeatable),
+    `?header=1` if the first TSV line holds the column names.
+    Errors are streamed as JSON lines, followed by a summary line. Bytes
+    that are not valid UTF-8 are replaced (with U+FFFD), so that the tags
+    containing them are reported.
+    """
+    if corpus_format not in FORMATS:
+        return jsonify({"message": f"Unknown format '{corpus_format}'."}), 400
+
+    stream = io.TextIOWrapper(
+        request.stream, encoding="utf-8", errors="replace"
+    )
+    header = None
+    first_line = 1
+    if request.args.get("header"):
+        header = stream.readline().rstrip("\r\n").split("\t")
+        first_line = 2
+    try:
+        validator = Validator(
+            get_vocabularies(TAGSET.get()),
+            parse_columns(request.args.getlist("column"), corpus_format, header),
+            corpus_format
+        )
+    except (ValueError, IndexError) as e:
+        return jsonify({"message": str(e)}), 400
+
+    def generate():
+        for error in validator.validate(stream, first_line):
+            yield f"{json.dumps(error, ensure_ascii=False)}\n"
+        yield f"{json.dumps({'summary': validator.counts})}\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-ndjson"
+    )
+
 ###############################################################################
 
 
@@ -412,6 +716,9 @@ def show_login():
         user = User.query.filter_by(username=username).one_or_none()
         if user is not None:
             if check_password_hash(user.password, password):
+                if password_needs_rehash(user.password):
+                    user.password = password
+                    db.session.commit()
                 login_user(user)
                 flash("Logged in successfully.", "success")
                 return redirect(
@@ -435,12 +742,14 @@ def logout():
 # --------------------------------------------------------------------------- #
 
 @webapp.route("/terms")
+@cached_page
 def show_terms():
     data = {'title': 'Terms of Use'}
     return render_template('terms.html', data=data)
 
 
 @webapp.route("/team")
+@cached_page
 def show_team():
     data = {'title': 'Team'}
     data['team'] = settings.TEAM
@@ -448,6 +757,7 @@ def show_team():
 
 
 @webapp.route("/contact")
+@cached_page
 def show_contact():
     data = {'title': 'Contact Us'}
     contacts = []
@@ -473,6 +783,7 @@ def show_contact():
 
 
 @webapp.route("/")
+@cached_page
 def show_home():
     data = {"title": "About"}
     return render_template("about.html", data=data)
@@ -521,6 +832,7 @@ def show_graph():
     return render_template("graph.html", data=data)
 
 @webapp.route("/publications/", methods=["GET"])
+@cached_page
 def list_publications():
     data = {"title": "Publications"}
     data["publications"] = Publication.query.filter(
@@ -530,9 +842,65 @@ def list_publications():
     return render_template("publications.html", data=data)
 
 
+@webapp.route("/publications.bib", methods=["GET"])
+def list_publications_bibtex():
+    publications = Publication.query.filter(
+        Publication.is_visible == True,  # noqa
+        Publication.is_deleted == False  # noqa
+    ).order_by(Publication.year.desc(), Publication.id)
+
+    def generate():
+        for publication in publications.yield_per(100):
+            yield f"{publication.bibtex}\n\n"
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="application/x-bibtex",
+        headers={"Content-Disposition": "inline; filename=publications.bib"}
+    )
+
+
 @webapp.route("/publications/<string:filename>")
 def serve_publication(filename: str):
-    return send_from_directory(webapp.config["UPLOAD_FOLDER"], filename)
+    """Serve an uploaded publication
+
+    Conditional (`If-None-Match`, `If-Modified-Since`) and `Range` requests
+    are answered by Flask itself, unless `settings.PUBLICATION_SENDFILE`
+    hands the transfer over to the front-end server:
+
+    "x-accel-redirect" (nginx)
+        location /protected-uploads/ {
+            internal;
+            alias /path/to/uploads/;
+        }
+    "x-sendfile" (Apache mod_xsendfile, lighttpd)
+        XSendFile On
+        XSendFilePath /path/to/uploads/
+    """
+    upload_dir = webapp.config["UPLOAD_FOLDER"]
+    filepath = safe_join(upload_dir, filename)
+    if filepath is None or not os.path.isfile(filepath):
+        abort(404)
+
+    if settings.PUBLICATION_SENDFILE in ["x-accel-redirect", "x-sendfile"]:
+        mimetype, _ = mimetypes.guess_type(filename)
+        response = Response(mimetype=mimetype or "application/octet-stream")
+        if settings.PUBLICATION_SENDFILE == "x-accel-redirect":
+            response.headers["X-Accel-Redirect"] = (
+                f"{settings.PUBLICATION_ACCEL_REDIRECT_PREFIX.rstrip('/')}/"
+                f"{quote(filename)}"
+            )
+        else:
+            response.headers["X-Sendfile"] = os.path.abspath(filepath)
+        return response
+
+    return send_from_directory(
+        upload_dir,
+        filename,
+        conditional=True,
+        etag=True,
+        max_age=settings.PUBLICATION_MAX_AGE
+    )
 
 
 ###############################################################################
@@ -36,7 +36,7 @@ DATABASE_DIR = os.path.join(APP_DIR, "db/")
 
 # --------------------------------------------------------------------------- #
 
-MAX_SELECT = 3
+MAX_SELECT = 10
 
 NAVIGATION = {
     "about": ("show_home", "About"),
@@ -51,6 +51,14 @@ FOOTER_LINKS = {
     "contact": ("show_contact", "Contact"),
 }
 
+# --------------------------------------------------------------------------- #
+# password hashing (werkzeug method string, e.g. "scrypt:32768:8:1")
+# passwords hashed with other parameters are rehashed on the next login
+# use benchmarks/login.py to measure logins per second per core
+
+PASSWORD_HASH_METHOD = "pbkdf2:sha256:600000"
+PASSWORD_SALT_LENGTH = 16
+
 # --------------------------------------------------------------------------- #
 # list of administrators
 
@@ -101,4 +109,91 @@ DEFAULT_LABELS = {
 # SQLAlchemy compatible database-uri
 DATABASE_URI = f"sqlite:///{os.path.join(DATABASE_DIR, 'main.db')}"
 
+# number of rows inserted per transaction during bulk import
+BULK_IMPORT_CHUNK_SIZE = 1000
+
+# number of rows fetched at a time while streaming admin exports
+EXPORT_YIELD_PER = 1000
+
+# seconds after which cached admin list counts are recomputed
+ADMIN_COUNT_RECONCILE_INTERVAL = 300
+# estimate admin list counts from the largest id instead of counting rows
+ADMIN_APPROXIMATE_COUNT = False
+
+# --------------------------------------------------------------------------- #
+# Caching
+
+# seconds for which a logged in user is served without a database lookup
+USER_CACHE_TTL = 60
+USER_CACHE_SIZE = 10000
+
+# seconds for which rendered public pages (about, terms, team, contact,
+# publications) are served from memory; cleared when publications change
+PAGE_CACHE_TTL = 3600
+PAGE_CACHE_SIZE = 10000
+# seconds between checks (by every worker) for publication changes made by
+# other workers or hosts
+PAGE_CACHE_POLL_INTERVAL = 5
+
+# seconds for which the read-only API payloads served by asgi.py are reused
+ASGI_PAYLOAD_CACHE_TTL = 60
+ASGI_PAYLOAD_CACHE_SIZE = 1024
+
+# seconds between checks (by every worker) for tag changes made by other
+# workers or hosts; the in-memory tagset is rebuilt in the background
+TAGSET_POLL_INTERVAL = 5
+# number of tags (per category) whose examples are kept in memory by every
+# worker; the others are read from the database when requested
+TAGSET_DATA_CACHE_SIZE = 1024
+
+# --------------------------------------------------------------------------- #
+# Rate Limiting
+
+# shared by all worker processes on a host; "memory://" keeps separate
+# counters in every worker (see utils/ratelimit.py)
+RATE_LIMIT_STORAGE_URI = f"sqlite:///{os.path.join(DATABASE_DIR, 'limits.db')}"
+RATE_LIMIT_STRATEGY = "sliding-window-counter"
+# per client, for every endpoint (of both the WSGI and the ASGI application)
+RATE_LIMIT_DEFAULT = "1800 per hour"
+
+# --------------------------------------------------------------------------- #
+# Response Compression
+# (may be disabled if a front-end server already compresses responses)
+
+COMPRESS_RESPONSES = True
+COMPRESS_MIN_SIZE = 1024              # bytes
+COMPRESS_LEVEL = 6
+COMPRESS_CACHE_SIZE = 1024            # number of compressed bodies to keep
+COMPRESS_CACHE_BYTES = 64 * 1024 * 1024  # total size of those bodies
+
+# --------------------------------------------------------------------------- #
+# Publication Downloads
+
+# seconds for which browsers may reuse a downloaded publication
+PUBLICATION_MAX_AGE = 3600
+# None (served by Flask), "x-accel-redirect" (nginx) or "x-sendfile"
+# see `serve_publication` in server.py for the front-end configuration
+PUBLICATION_SENDFILE = None
+PUBLICATION_ACCEL_REDIRECT_PREFIX = "/protected-uploads/"
+
+# --------------------------------------------------------------------------- #
+# SQL Instrumentation
+# (adds X-SQL-Statements, X-SQL-Time and Server-Timing response headers,
+#  logs slow statements and collects per-endpoint histograms at
+#  /api/debug/sql for admins; no overhead when disabled)
+
+SQL_INSTRUMENTATION = False
+SQL_SLOW_QUERY_THRESHOLD = 0.1        # seconds
+
+# --------------------------------------------------------------------------- #
+# Metrics
+# (prometheus format at /metrics, requires `prometheus_client`;
+#  restrict access to /metrics at the front-end server)
+
+METRICS_ENABLED = False
+# directory shared by the worker processes to aggregate their metrics;
+# required with multiple workers, emptied on server start
+# (see utils/metrics.py)
+METRICS_MULTIPROC_DIR = None
+
 ###############################################################################
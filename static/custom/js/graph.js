@@ -28,12 +28,94 @@ function parse_dependency_relations(graph_input) {
     return dot_text.join("\n");
 }
 
+/* ------------------------------------------------------------------------- */
+// Graph Rendering
+// The Viz.js engine (VIZ_URL) is loaded on the first render, inside a Web
+// Worker (GRAPH_WORKER_URL) when available, and shared by all renders.
+
+const graph_renderer = {
+    worker: null,
+    viz_promise: null,
+    requests: {},
+    last_request_id: 0,
+};
+
+function get_graph_worker() {
+    if (graph_renderer.worker === null && window.Worker) {
+        try {
+            graph_renderer.worker = new Worker(GRAPH_WORKER_URL);
+        } catch (error) {
+            console.error("Graph worker unavailable: ", error);
+            graph_renderer.worker = false;
+            return null;
+        }
+        graph_renderer.worker.onmessage = function (event) {
+            const response = event.data;
+            const callback = graph_renderer.requests[response.id];
+            delete graph_renderer.requests[response.id];
+            if (callback) {
+                callback(response);
+            }
+        };
+    }
+    return graph_renderer.worker || null;
+}
+
+function load_viz() {
+    // fallback for browsers without Web Workers
+    if (graph_renderer.viz_promise === null) {
+        graph_renderer.viz_promise = new Promise(function (resolve, reject) {
+            const script = document.createElement("script");
+            script.src = VIZ_URL;
+            script.onload = resolve;
+            script.onerror = reject;
+            document.head.appendChild(script);
+        }).then(function () {
+            return Viz.instance();
+        });
+    }
+    return graph_renderer.viz_promise;
+}
+
+function render_svg(dot_text, callback) {
+    const worker = get_graph_worker();
+    if (worker) {
+        const request_id = ++graph_renderer.last_request_id;
+        graph_renderer.requests[request_id] = callback;
+        worker.postMessage({
+            id: request_id,
+            viz_url: new URL(VIZ_URL, window.location.href).href,
+            dot: dot_text
+        });
+    } else {
+        load_viz().then(function (viz) {
+            callback({svg: viz.renderString(dot_text, {format: "svg"})});
+        }).catch(function (error) {
+            callback({error: error.message || String(error)});
+        });
+    }
+}
+
 function render_graph_in_container(graph_input, $graph_container) {
-    $graph_container.empty();
-    Viz.instance().then(function(viz) {
-        const svg = viz.renderSVGElement(graph_input);
+    const container = $graph_container[0];
+    // only the latest render request updates a container
+    const render_id = (container.render_id || 0) + 1;
+    container.render_id = render_id;
+
+    render_svg(graph_input, function (response) {
+        if (container.render_id != render_id) {
+            return;
+        }
+        $graph_container.empty();
+        if (response.error) {
+            console.error(response.error);
+            return;
+        }
+        const svg = new DOMParser().parseFromString(
+            response.svg, "image/svg+xml"
+        ).documentElement;
         svg.style.maxWidth = '100%';
         svg.style.maxHeight = '100%';
-        $graph_container[0].appendChild(svg);
+        container.appendChild(document.importNode(svg, true));
     });
 }
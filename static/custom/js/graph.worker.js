@@ -0,0 +1,38 @@
+/* ------------------------------------------------------------------------- */
+// Graph Rendering Worker
+// Loads the Viz.js engine on the first request and renders DOT to SVG
+// off the main thread.
+// Request: {id: int, viz_url: str, dot: str}
+// Response: {id: int, svg: str} or {id: int, error: str}
+
+let viz_promise = null;
+
+self.onmessage = function (event) {
+    const request = event.data;
+    if (viz_promise === null) {
+        try {
+            importScripts(request.viz_url);
+            viz_promise = Viz.instance();
+        } catch (error) {
+            self.postMessage({id: request.id, error: error.message});
+            return;
+        }
+    }
+    viz_promise.then(function (viz) {
+        try {
+            const svg = viz.renderString(request.dot, {format: "svg"});
+            self.postMessage({id: request.id, svg: svg});
+        } catch (error) {
+            self.postMessage({id: request.id, error: error.message});
+        }
+    }, function (error) {
+        // the engine is loaded again by the next request
+        viz_promise = null;
+        self.postMessage({
+            id: request.id,
+            error: (error && error.message) || String(error)
+        });
+    });
+};
+
+/* ------------------------------------------------------------------------- */
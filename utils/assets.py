@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static Asset Pipeline
+
+Build step
+----------
+1. Vendor the third-party assets used by the templates (and the fonts and
+   images their stylesheets refer to) into `static/vendor/`.
+2. Copy every file of `static/` to `static/dist/` under a content-hashed
+   name, rewriting `url(...)` references in stylesheets to the hashed
+   names, and write `.gz` (and `.br`, if `brotli` is installed) siblings
+   of compressible files.
+3. Write `static/dist/manifest.json` mapping original to hashed names.
+
+    $ python3 utils/assets.py
+
+Serving
+-------
+`StaticAssets(app)` loads the manifest, so that `url_for('static', ...)`
+produces hashed names, which are served with immutable cache headers and
+precompressed bodies. `vendor_url(url)` in templates resolves a CDN URL to
+its vendored copy when one has been built. Without a manifest, both fall
+back to the original names and CDN URLs.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import re
+import gzip
+import json
+import shutil
+import hashlib
+import logging
+import mimetypes
+import posixpath
+import urllib.request
+from urllib.error import URLError
+from urllib.parse import urljoin, urlsplit
+
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+###############################################################################
+
+DIST_DIR = "dist"
+VENDOR_DIR = "vendor"
+MANIFEST_FILENAME = "manifest.json"
+
+CACHE_CONTROL_IMMUTABLE = "public, max-age=31536000, immutable"
+
+COMPRESSIBLE_EXTENSIONS = {
+    ".js", ".css", ".svg", ".json", ".map", ".txt", ".ttf", ".eot", ".html"
+}
+MIN_COMPRESS_SIZE = 512
+
+# (encoding, file extension) in order of preference
+PRECOMPRESSED_ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+CSS_URL_PATTERN = re.compile(r"""url\(\s*(['"]?)([^'")]+)\1\s*\)""")
+
+# Third-party assets loaded by templates/base.html
+VENDOR_ASSETS = [
+    "https://bootswatch.com/5/united/bootstrap.min.css",
+    "https://cdn.jsdelivr.net/npm/bootstrap-icons@1.7.2/font/bootstrap-icons.css",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/bootstrap-table.min.css",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/extensions/sticky-header/bootstrap-table-sticky-header.css",
+    "https://unpkg.com/jquery-resizable-columns@0.2.3/dist/jquery.resizableColumns.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/css/all.min.css",
+    "https://cdnjs.cloudflare.com/ajax/libs/select2/4.0.13/css/select2.min.css",
+    "https://cdn.jsdelivr.net/npm/jquery@3.5.1/dist/jquery.min.js",
+    "https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/js/bootstrap.bundle.min.js",
+    "https://cdn.jsdelivr.net/npm/tableexport.jquery.plugin@1.10.21/tableExport.min.js",
+    "https://cdn.jsdelivr.net/npm/tableexport.jquery.plugin@1.10.21/libs/jsPDF/jspdf.min.js",
+    "https://cdn.jsdelivr.net/npm/tableexport.jquery.plugin@1.10.21/libs/jsPDF-AutoTable/jspdf.plugin.autotable.js",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/bootstrap-table.js",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/extensions/copy-rows/bootstrap-table-copy-rows.min.js",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/extensions/sticky-header/bootstrap-table-sticky-header.min.js",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/extensions/filter-control/bootstrap-table-filter-control.min.js",
+    "https://unpkg.com/jquery-resizable-columns@0.2.3/dist/jquery.resizableColumns.min.js",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/extensions/resizable/bootstrap-table-resizable.min.js",
+    "https://unpkg.com/bootstrap-table@1.21.4/dist/extensions/export/bootstrap-table-export.min.js",
+    "https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.2/js/all.min.js",
+    "https://cdnjs.cloudflare.com/ajax/libs/select2/4.0.13/js/select2.min.js",
+]
+
+###############################################################################
+
+
+def vendor_path(url: str) -> str:
+    """Path of the vendored copy of `url`, relative to the static folder"""
+    parts = urlsplit(url)
+    return posixpath.join(VENDOR_DIR, parts.netloc, parts.path.lstrip("/"))
+
+
+def is_local_reference(reference: str) -> bool:
+    return not (
+        reference.startswith(("data:", "#", "/", "//"))
+        or urlsplit(reference).scheme
+    )
+
+
+def vendor_assets(static_dir: str, urls: list = None, force: bool = False):
+    """Download third-party assets and the files their stylesheets refer to
+
+    Parameters
+    ----------
+    static_dir : str
+        Path of the static folder
+    urls : list, optional
+        URLs to vendor.
+        The default is None, in which case `VENDOR_ASSETS` are vendored.
+    force : bool, optional
+        Download again even if a vendored copy exists.
+        The default is False.
+    """
+    pending = list(urls or VENDOR_ASSETS)
+    seen = set()
+    while pending:
+        url = pending.pop()
+        download_url = url.split("#")[0].split("?")[0]
+        if download_url in seen:
+            continue
+        seen.add(download_url)
+
+        local_path = os.path.join(static_dir, vendor_path(download_url))
+        if force or not os.path.isfile(local_path):
+            LOGGER.info(f"Downloading {download_url}")
+            try:
+                with urllib.request.urlopen(download_url) as response:
+                    content = response.read()
+            except URLError as e:
+                # templates keep using the CDN URL for this asset
+                LOGGER.warning(f"Could not download {download_url} ({e})")
+                continue
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            with open(local_path, "wb") as f:
+                f.write(content)
+
+        if local_path.endswith(".css"):
+            with open(local_path, encoding="utf-8") as f:
+                css = f.read()
+            for _, reference in CSS_URL_PATTERN.findall(css):
+                if is_local_reference(reference):
+                    pending.append(urljoin(download_url, reference))
+
+
+###############################################################################
+
+
+def file_hash(filepath: str) -> str:
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        for block in iter(lambda: f.read(65536), b""):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def fingerprinted_name(filename: str, digest: str) -> str:
+    stem, extension = posixpath.splitext(filename)
+    return f"{stem}.{digest}{extension}"
+
+
+def rewrite_css_urls(css: str, filename: str, manifest: dict) -> str:
+    """Point relative `url(...)` references of a stylesheet to hashed names"""
+    directory = posixpath.dirname(filename)
+
+    def replace_reference(match):
+        quote, reference = match.groups()
+        if not is_local_reference(reference):
+            return match.group(0)
+        split_at = min(
+            (i for i in (reference.find("?"), reference.find("#")) if i >= 0),
+            default=len(reference)
+        )
+        path, suffix = reference[:split_at], reference[split_at:]
+        target = posixpath.normpath(posixpath.join(directory, path))
+        if target not in manifest:
+            return match.group(0)
+        hashed = posixpath.relpath(
+            posixpath.join(DIST_DIR, manifest[target]),
+            posixpath.join(DIST_DIR, directory)
+        )
+        return f"url({quote}{hashed}{suffix}{quote})"
+
+    return CSS_URL_PATTERN.sub(replace_reference, css)
+
+
+def compress_file(filepath: str):
+    with open(filepath, "rb") as f:
+        content = f.read()
+    if len(content) < MIN_COMPRESS_SIZE:
+        return
+    with open(f"{filepath}.gz", "wb") as f:
+        f.write(gzip.compress(content, compresslevel=9, mtime=0))
+    if brotli is not None:
+        with open(f"{filepath}.br", "wb") as f:
+            f.write(brotli.compress(content))
+
+
+def build_assets(static_dir: str) -> dict:
+    """Write hashed and precompressed copies of all static files
+
+    Parameters
+    ----------
+    static_dir : str
+        Path of the static folder
+
+    Returns
+    -------
+    dict
+        Manifest mapping original filenames to hashed filenames, both
+        relative to the static folder and the `dist` folder respectively
+    """
+    dist_dir = os.path.join(static_dir, DIST_DIR)
+    if os.path.isdir(dist_dir):
+        shutil.rmtree(dist_dir)
+
+    filenames = []
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = sorted(d for d in dirs if d != DIST_DIR or root != static_dir)
+        for name in sorted(files):
+            filepath = os.path.join(root, name)
+            filenames.append(
+                os.path.relpath(filepath, static_dir).replace(os.sep, "/")
+            )
+
+    manifest = {}
+    # stylesheets are processed last, as their references are rewritten
+    filenames.sort(key=lambda name: name.endswith(".css"))
+    for filename in filenames:
+        source_path = os.path.join(static_dir, filename)
+        if filename.endswith(".css"):
+            with open(source_path, encoding="utf-8") as f:
+                content = rewrite_css_urls(f.read(), filename, manifest)
+            content = content.encode("utf-8")
+            digest = hashlib.sha256(content).hexdigest()[:12]
+        else:
+            content = None
+            digest = file_hash(source_path)
+
+        hashed_filename = fingerprinted_name(filename, digest)
+        target_path = os.path.join(dist_dir, hashed_filename)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        if content is None:
+            shutil.copyfile(source_path, target_path)
+        else:
+            with open(target_path, "wb") as f:
+                f.write(content)
+
+        if posixpath.splitext(filename)[1] in COMPRESSIBLE_EXTENSIONS:
+            compress_file(target_path)
+        manifest[filename] = hashed_filename
+
+    with open(os.path.join(dist_dir, MANIFEST_FILENAME), "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    return manifest
+
+
+###############################################################################
+
+
+class StaticAssets:
+    """Serve fingerprinted, precompressed static files built by this module
+
+    Parameters
+    ----------
+    app : Flask, optional
+        Flask application
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.static_folder = app.static_folder
+        manifest_path = os.path.join(
+            self.static_folder, DIST_DIR, MANIFEST_FILENAME
+        )
+        if os.path.isfile(manifest_path):
+            with open(manifest_path) as f:
+                self.manifest = json.load(f)
+        else:
+            LOGGER.info("No asset manifest found, serving unversioned assets.")
+
+        app.url_defaults(self.fingerprint_url)
+        app.view_functions["static"] = self.send_static_file
+        app.jinja_env.globals["vendor_url"] = self.vendor_url
+
+    def fingerprint_url(self, endpoint, values):
+        if endpoint == "static" and "filename" in values:
+            hashed_filename = self.manifest.get(values["filename"])
+            if hashed_filename is not None:
+                values["filename"] = posixpath.join(DIST_DIR, hashed_filename)
+
+    def vendor_url(self, url: str) -> str:
+        """URL of the vendored copy of `url` if it exists, `url` otherwise"""
+        filename = vendor_path(url)
+        if filename in self.manifest:
+            return url_for("static", filename=filename)
+        return url
+
+    def send_static_file(self, filename: str):
+        if not filename.startswith(f"{DIST_DIR}/"):
+            return send_from_directory(self.static_folder, filename)
+
+        mimetype, _ = mimetypes.guess_type(filename)
+        accept_encodings = request.accept_encodings
+        for encoding, extension in PRECOMPRESSED_ENCODINGS:
+            if encoding not in accept_encodings:
+                continue
+            compressed_filepath = os.path.join(
+                self.static_folder, f"{filename}{extension}"
+            )
+            if os.path.isfile(compressed_filepath):
+                response = send_from_directory(
+                    self.static_folder,
+                    f"{filename}{extension}",
+                    mimetype=mimetype
+                )
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = send_from_directory(self.static_folder, filename)
+
+        response.headers["Cache-Control"] = CACHE_CONTROL_IMMUTABLE
+        response.vary.add("Accept-Encoding")
+        return response
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    sys.path.insert(
+        0, os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    )
+    import settings
+
+    parser = argparse.ArgumentParser(description="Build static assets")
+    parser.add_argument(
+        "--no-vendor", action="store_true",
+        help="Do not download third-party assets"
+    )
+    parser.add_argument(
+        "--force-vendor", action="store_true",
+        help="Download third-party assets even if vendored copies exist"
+    )
+    args = vars(parser.parse_args())
+
+    logging.basicConfig(level=logging.INFO)
+
+    if not args["no_vendor"]:
+        vendor_assets(settings.STATIC_DIR, force=args["force_vendor"])
+    _manifest = build_assets(settings.STATIC_DIR)
+    print(f"Built {len(_manifest)} assets in {settings.STATIC_DIR}{DIST_DIR}")
+
+###############################################################################
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-Process Caches
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import time
+import threading
+
+import settings
+
+###############################################################################
+
+
+class TTLCache:
+    """Thread-safe in-process cache whose entries expire after `ttl` seconds
+
+    Each worker process holds its own cache, so a change made by one worker
+    is seen by the others once their entries expire.
+
+    Parameters
+    ----------
+    ttl : float
+        Lifetime of an entry in seconds
+    maxsize : int, optional
+        Maximum number of entries. When exceeded, the oldest entries are
+        dropped.
+        The default is None, which means the cache is unbounded.
+    maxbytes : int, optional
+        Maximum total length of the values (e.g. `bytes`). When exceeded,
+        the oldest entries are dropped, and values longer than that are
+        not stored.
+        The default is None, which means the length is not bounded.
+
+    The number of `hits` and `misses` of `get` are counted.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = None, maxbytes: int = None):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _size(self, value) -> int:
+        return len(value) if self.maxbytes is not None else 0
+
+    def _drop(self, key):
+        _, value = self._data.pop(key)
+        self.nbytes -= self._size(value)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expiry, value = item
+            if expiry < time.monotonic():
+                self._drop(key)
+                self.misses += 1
+                return default
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self._size(value)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            if self.maxbytes is not None and size > self.maxbytes:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self.nbytes += size
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._drop(next(iter(self._data)))
+            if self.maxbytes is not None:
+                while self.nbytes > self.maxbytes:
+                    self._drop(next(iter(self._data)))
+
+    def pop(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            item = self._data[key]
+            self._drop(key)
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+###############################################################################
+
+USER_CACHE = TTLCache(
+    ttl=settings.USER_CACHE_TTL,
+    maxsize=settings.USER_CACHE_SIZE
+)
+
+# name of the `DataVersion` bumped when cached pages become outdated
+PAGES_VERSION = "pages"
+
+PAGE_CACHE = TTLCache(
+    ttl=settings.PAGE_CACHE_TTL,
+    maxsize=settings.PAGE_CACHE_SIZE
+)
+
+# entries are validated against the publication content when read
+BIBTEX_CACHE = TTLCache(
+    ttl=settings.PAGE_CACHE_TTL,
+    maxsize=settings.PAGE_CACHE_SIZE
+)
+
+###############################################################################
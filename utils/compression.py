@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Response Compression Middleware
+
+@author: Hrishikesh Terdalkar
+"""
+
+import gzip
+import hashlib
+
+from werkzeug.http import parse_accept_header
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from utils.cache import TTLCache
+
+###############################################################################
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/html",
+    "text/css",
+    "text/csv",
+    "text/plain",
+    "text/javascript",
+    "text/tab-separated-values",
+    "image/svg+xml",
+}
+
+# bodies worth caching even without an application ETag: payloads shared by
+# many clients. Pages (text/html) are never cached, as the CSRF token makes
+# every one of them unique.
+CACHEABLE_MIMETYPES = {
+    "application/json",
+    "application/javascript",
+    "text/javascript",
+    "text/css",
+    "image/svg+xml",
+}
+UNCACHEABLE_MIMETYPES = {"text/html"}
+
+###############################################################################
+
+
+class Compressed(object):
+    '''Compress response bodies with brotli or gzip, as the client accepts
+
+    Only complete (non-streamed) `200 OK` responses of a compressible
+    content type, that are not already encoded and are at least
+    `min_size` bytes long, are compressed.
+
+    Compressed bodies are cached by the ETag of the response (the SHA-1 of
+    the body when the application did not set one) and the encoding, so
+    identical payloads, such as the same API response requested by many
+    clients, are compressed once. Only bodies with an ETag set by the
+    application, or of a `CACHEABLE_MIMETYPES` type, are cached, and never
+    HTML pages. The representation ETag is sent to the client, and a
+    matching `If-None-Match` is answered with `304`.
+
+    If a front-end server already compresses responses, there is no need
+    for this middleware; with nginx:
+        gzip on;
+        gzip_types application/json text/css application/javascript;
+
+    :param app: the WSGI application
+    :param min_size: smallest body (in bytes) worth compressing
+    :param max_size: largest body (in bytes) to buffer for compression
+    :param level: gzip compression level
+    :param cache_size: number of compressed bodies to keep
+    :param cache_bytes: total size (in bytes) of compressed bodies to keep
+    :param cache_ttl: seconds to keep a compressed body
+    '''
+    def __init__(self, app, min_size=1024, max_size=16 * 1024 * 1024,
+                 level=6, cache_size=1024, cache_bytes=64 * 1024 * 1024,
+                 cache_ttl=3600):
+        self.app = app
+        self.min_size = min_size
+        self.max_size = max_size
+        self.level = level
+        self.cache = TTLCache(
+            ttl=cache_ttl, maxsize=cache_size, maxbytes=cache_bytes
+        )
+
+    def negotiate(self, environ):
+        if environ.get("REQUEST_METHOD") not in ("GET", "POST"):
+            return None
+        accept = parse_accept_header(environ.get("HTTP_ACCEPT_ENCODING", ""))
+        if brotli is not None and accept.quality("br") > 0:
+            return "br"
+        if accept.quality("gzip") > 0:
+            return "gzip"
+        return None
+
+    def compress(self, body, encoding):
+        if encoding == "br":
+            return brotli.compress(body, quality=min(self.level + 3, 11))
+        return gzip.compress(body, compresslevel=self.level, mtime=0)
+
+    @staticmethod
+    def is_cacheable(headers, has_etag):
+        names = {name.lower(): value for name, value in headers}
+        mimetype = names.get("content-type", "").split(";")[0].strip()
+        if mimetype in UNCACHEABLE_MIMETYPES:
+            return False
+        return has_etag or mimetype in CACHEABLE_MIMETYPES
+
+    def is_compressible(self, status, headers):
+        if not status.startswith("200"):
+            return False
+        names = {name.lower(): value for name, value in headers}
+        if "content-encoding" in names or "content-range" in names:
+            return False
+        mimetype = names.get("content-type", "").split(";")[0].strip()
+        if mimetype not in COMPRESSIBLE_MIMETYPES:
+            return False
+        try:
+            length = int(names.get("content-length", ""))
+        except ValueError:
+            # streamed response
+            return False
+        return self.min_size <= length <= self.max_size
+
+    def __call__(self, environ, start_response):
+        encoding = self.negotiate(environ)
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        captured = {}
+        written = []
+
+        def capture_start_response(status, headers, exc_info=None):
+            captured["status"] = status
+            captured["headers"] = headers
+            captured["exc_info"] = exc_info
+            return written.append
+
+        app_iter = self.app(environ, capture_start_response)
+        chunks = iter(app_iter)
+        first_chunks = []
+        while "status" not in captured:
+            try:
+                first_chunks.append(next(chunks))
+            except StopIteration:
+                break
+
+        status = captured["status"]
+        if not self.is_compressible(status, captured["headers"]):
+            start_response(status, captured["headers"], captured["exc_info"])
+            if not (written or first_chunks):
+                return app_iter
+            return self.passthrough(app_iter, written + first_chunks, chunks)
+
+        try:
+            body = b"".join(written + first_chunks + list(chunks))
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+        etag = None
+        vary = []
+        headers = []
+        for name, value in captured["headers"]:
+            if name.lower() == "etag":
+                etag = value
+            elif name.lower() == "vary":
+                vary.extend(v.strip() for v in value.split(",") if v.strip())
+            elif name.lower() != "content-length":
+                headers.append((name, value))
+
+        cacheable = self.is_cacheable(captured["headers"], etag is not None)
+        if etag is None:
+            etag = f'"{hashlib.sha1(body).hexdigest()}"'
+        representation_etag = f'{etag[:-1]}-{encoding}"'
+
+        if "accept-encoding" not in (v.lower() for v in vary):
+            vary.append("Accept-Encoding")
+        headers.append(("Vary", ", ".join(vary)))
+        headers.append(("ETag", representation_etag))
+
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH", "")
+        if representation_etag in [
+            tag.strip() for tag in if_none_match.split(",")
+        ]:
+            headers = [
+                (name, value) for name, value in headers
+                if name.lower() != "content-type"
+            ]
+            start_response("304 Not Modified", headers)
+            return []
+
+        if cacheable:
+            cache_key = (etag, encoding)
+            compressed_body = self.cache.get(cache_key)
+            if compressed_body is None:
+                compressed_body = self.compress(body, encoding)
+                self.cache.set(cache_key, compressed_body)
+        else:
+            compressed_body = self.compress(body, encoding)
+
+        headers.append(("Content-Encoding", encoding))
+        headers.append(("Content-Length", str(len(compressed_body))))
+        start_response(status, headers)
+        return [compressed_body]
+
+    @staticmethod
+    def passthrough(app_iter, first_chunks, chunks):
+        try:
+            yield from first_chunks
+            yield from chunks
+        finally:
+            if hasattr(app_iter, "close"):
+                app_iter.close()
+
+
+###############################################################################
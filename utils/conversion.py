@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Legacy Tag Conversion
+
+Rewrites corpora annotated with legacy tagsets into Samanvaya tags, using
+the mappings stored with the tags:
+    * `PartsOfSpeechTag.bis_tag` for BIS part-of-speech tags (e.g. N_NN),
+    * `DependencyTag.existing_tag` for legacy dependency labels (e.g. k1).
+
+The mappings are compiled into lookup tables once per tagset snapshot.
+Corpora are converted line by line, so memory use does not depend on
+their size; large files can be converted chunk by chunk in parallel.
+Tags without a mapping, or with more than one possible Samanvaya tag,
+are left unchanged and reported.
+
+Samanvaya codes are written by default: tags may contain spaces (e.g.
+"apadana (source of separation)"), which are not allowed in CoNLL-U
+columns, so those are never written and are reported, like ambiguous ones.
+
+    $ python3 utils/conversion.py corpus.conllu -o corpus.samanvaya.conllu
+    $ python3 utils/conversion.py corpus.tsv -f tsv -c 2=parts_of_speech_tag
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import re
+import sys
+import logging
+import functools
+from collections import Counter
+
+if __name__ == "__main__":
+    sys.path.insert(
+        0, os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    )
+
+from utils.validation import (
+    FORMAT_CONLLU, FORMATS, EMPTY_VALUES, process_parallel
+)
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+###############################################################################
+
+TARGET_TAG = "tag"
+TARGET_CODE = "code"
+TARGETS = (TARGET_TAG, TARGET_CODE)
+
+# rank of a legacy label, lower ones are preferred when a label is listed
+# for more than one tag
+EXACT = 0
+PARTIAL = 1
+
+PARENTHESES_PATTERN = re.compile(r"\(.*?\)")
+
+###############################################################################
+
+
+def split_bis_tag(value: str):
+    """Labels of a BIS tag (`V_VM_VF`): the tag itself, with `__` as the
+    separator (`V__VM__VF`) and, with a lower rank, the last level (`VF`)"""
+    value = value.strip()
+    if not value:
+        return
+    yield value, EXACT
+    if "_" in value:
+        yield value.replace("_", "__"), EXACT
+        yield value.rsplit("_", 1)[-1], PARTIAL
+
+
+def split_existing_tag(value: str):
+    """Labels of a legacy dependency mapping (`nmod, k1s`)
+
+    Remarks in parentheses lower the rank of a label (`k7 (type of k7)`),
+    remarks alone (`(new tag)`) and uncertain labels (`ccof?`) are skipped.
+    """
+    for label in value.split(","):
+        label = label.strip()
+        if not label or label.endswith("?"):
+            continue
+        bare_label = PARENTHESES_PATTERN.sub("", label).strip()
+        if bare_label:
+            yield bare_label, EXACT if bare_label == label else PARTIAL
+
+
+# category -> (column holding the legacy tag, function to split it)
+LEGACY_COLUMNS = {
+    "parts_of_speech_tag": ("bis_tag", split_bis_tag),
+    "dependency_tag": ("existing_tag", split_existing_tag),
+}
+
+###############################################################################
+
+
+@functools.lru_cache(maxsize=2)
+def compile_mappings(tagset, target: str = TARGET_CODE) -> dict:
+    """Lookup tables from legacy labels to Samanvaya codes (or tags)
+
+    A value containing whitespace cannot be written to a corpus column, so
+    a label standing for it alone is listed as `ambiguous` as well.
+
+    Returns
+    -------
+    dict
+        Category -> (mapping, ambiguous), where `mapping` maps a legacy
+        label to a single Samanvaya tag and `ambiguous` maps a legacy
+        label to the tuple of the Samanvaya tags it may stand for
+    """
+    mappings = {}
+    for name, (column, split) in LEGACY_COLUMNS.items():
+        category = tagset.categories.get(name)
+        if category is None:
+            continue
+
+        candidates = {}
+        for tag in category.tags:
+            value = (getattr(tag, target) or "").strip()
+            if not value:
+                continue
+            for label, rank in split(getattr(tag, column) or ""):
+                candidates.setdefault(label, {}).setdefault(rank, set()).add(
+                    value
+                )
+
+        mapping = {}
+        ambiguous = {}
+        for label, ranks in candidates.items():
+            values = ranks[min(ranks)]
+            value = next(iter(values))
+            if len(values) == 1 and not any(c.isspace() for c in value):
+                mapping[label] = value
+            else:
+                ambiguous[label] = tuple(sorted(values))
+        mappings[name] = (mapping, ambiguous)
+    return mappings
+
+
+###############################################################################
+
+
+class Converter:
+    """Replace legacy tags in the columns of corpus lines
+
+    Parameters
+    ----------
+    mappings : dict
+        Lookup tables, see `compile_mappings()`
+    columns : list
+        (index, column name, category) tuples, see `parse_columns()`
+    corpus_format : str
+        "conllu" or "tsv"
+    """
+
+    def __init__(self, mappings: dict, columns: list,
+                 corpus_format: str = FORMAT_CONLLU):
+        unknown = {c for _, _, c in columns if c not in mappings}
+        if unknown:
+            raise ValueError(
+                f"No legacy mapping for: {', '.join(sorted(unknown))}"
+            )
+        if corpus_format not in FORMATS:
+            raise ValueError(f"Unknown format '{corpus_format}'.")
+
+        self.columns = [
+            (index, name, category, *mappings[category])
+            for index, name, category in columns
+        ]
+        self.corpus_format = corpus_format
+        self.counts = Counter()
+        # (column, value, candidates) -> occurrences of unconverted tags
+        self.issues = Counter()
+
+    def convert(self, lines):
+        """Converted `lines`; `counts` and `issues` are updated as lines
+        are read"""
+        conllu = self.corpus_format == FORMAT_CONLLU
+        counts = self.counts
+        issues = self.issues
+        for line in lines:
+            counts["lines"] += 1
+            content = line.rstrip("\r\n")
+            if not content or (conllu and content.startswith("#")):
+                yield line
+                continue
+            fields = content.split("\t")
+            if conllu and ("-" in fields[0] or "." in fields[0]):
+                yield line
+                continue
+
+            counts["tokens"] += 1
+            for index, name, _, mapping, ambiguous in self.columns:
+                if index >= len(fields):
+                    continue
+                value = fields[index].strip()
+                if value in EMPTY_VALUES:
+                    continue
+                counts["values"] += 1
+                converted = mapping.get(value)
+                if converted is not None:
+                    fields[index] = converted
+                    counts["converted"] += 1
+                elif value in ambiguous:
+                    issues[(name, value, ambiguous[value])] += 1
+                    counts["ambiguous"] += 1
+                else:
+                    issues[(name, value, ())] += 1
+                    counts["unmapped"] += 1
+            yield "\t".join(fields) + line[len(content):]
+
+    def process_chunk(self, first_line: int, lines: list):
+        """Converted lines and counts of one chunk, see `process_parallel()`"""
+        counts, issues = self.counts, self.issues
+        self.counts, self.issues = Counter(), Counter()
+        converted = list(self.convert(lines))
+        report = (self.counts, self.issues)
+        self.counts, self.issues = counts, issues
+        return converted, report
+
+    def update(self, report: tuple):
+        counts, issues = report
+        self.counts.update(counts)
+        self.issues.update(issues)
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from utils.validation import DEFAULT_CONLLU_COLUMNS, parse_columns
+
+    parser = argparse.ArgumentParser(
+        description="Convert legacy (BIS) tags to Samanvaya tags"
+    )
+    parser.add_argument(
+        "corpus", nargs="?", default="-",
+        help="Corpus file (default: standard input)"
+    )
+    parser.add_argument(
+        "-o", "--output", default="-",
+        help="Output file (default: standard output)"
+    )
+    parser.add_argument(
+        "-f", "--format", choices=FORMATS, default=FORMAT_CONLLU,
+        help="Corpus format (default: conllu)"
+    )
+    parser.add_argument(
+        "-c", "--column", action="append", dest="columns", default=[],
+        help="Column to convert as COLUMN=CATEGORY (repeatable). "
+             "Default for CoNLL-U: " + ", ".join(
+                 f"{k}={v}" for k, v in DEFAULT_CONLLU_COLUMNS.items()
+             )
+    )
+    parser.add_argument(
+        "--header", action="store_true",
+        help="The first line of the TSV file holds the column names"
+    )
+    parser.add_argument(
+        "-t", "--target", choices=TARGETS, default=TARGET_CODE,
+        help="Write Samanvaya codes or tags (default: code); tags "
+             "containing spaces are reported instead"
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=None,
+        help="Number of worker processes (default: number of CPUs, 1 to "
+             "convert in this process)"
+    )
+    args = vars(parser.parse_args())
+
+    logging.basicConfig(level=logging.WARNING)
+
+    import server
+    from utils.tagset import TAGSET
+
+    with server.webapp.app_context():
+        _mappings = compile_mappings(TAGSET.get(), args["target"])
+
+    _input = (
+        sys.stdin
+        if args["corpus"] == "-"
+        else open(args["corpus"], encoding="utf-8")
+    )
+    _output = (
+        sys.stdout
+        if args["output"] == "-"
+        else open(args["output"], "w", encoding="utf-8")
+    )
+    with _input, _output:
+        _header = None
+        if args["header"]:
+            _header_line = _input.readline()
+            _output.write(_header_line)
+            _header = _header_line.rstrip("\r\n").split("\t")
+        try:
+            _converter = Converter(
+                _mappings,
+                parse_columns(args["columns"], args["format"], _header),
+                args["format"]
+            )
+        except ValueError as e:
+            parser.error(str(e))
+
+        if args["processes"] == 1:
+            _lines = _converter.convert(_input)
+        else:
+            _lines = process_parallel(_converter, _input, args["processes"])
+        _output.writelines(_lines)
+
+    _counts = _converter.counts
+    print(
+        f"{_counts['lines']} lines, {_counts['tokens']} tokens, "
+        f"{_counts['values']} tags: {_counts['converted']} converted, "
+        f"{_counts['unmapped']} unmapped, {_counts['ambiguous']} ambiguous",
+        file=sys.stderr
+    )
+    for (_column, _value, _candidates), _count in (
+        _converter.issues.most_common()
+    ):
+        print(
+            f"{_count}\t{_column}\t{_value}\t"
+            f"{'|'.join(_candidates) if _candidates else '(unmapped)'}",
+            file=sys.stderr
+        )
+
+###############################################################################
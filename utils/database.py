@@ -8,13 +8,17 @@ Functions
 
 ###############################################################################
 
+import json
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 
+from sqlalchemy import insert, select, update, func
+from sqlalchemy.exc import SQLAlchemyError, IntegrityError
 from sqlalchemy.orm import class_mapper
 
 import settings
-from models import db, User
+from models import db, User, ChangeLog, RowCount, DataVersion
+from constants import ACTION_CREATE
 
 ###############################################################################
 
@@ -23,6 +27,43 @@ LOGGER = logging.getLogger(__name__)
 ###############################################################################
 
 
+BOOLEAN_VALUES = {
+    "1": True, "true": True, "t": True, "yes": True, "y": True,
+    "0": False, "false": False, "f": False, "no": False, "n": False,
+}
+
+
+def convert_value(column, value):
+    """Convert a CSV value to the Python type of a column
+
+    Raises
+    ------
+    ValueError
+        If the value cannot be converted
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type is str:
+        return value
+    if value == "":
+        return None
+    if python_type is bool:
+        try:
+            return BOOLEAN_VALUES[value.lower()]
+        except KeyError:
+            raise ValueError(value) from None
+    if python_type is datetime:
+        return datetime.fromisoformat(value)
+    return python_type(value)
+
+
+###############################################################################
+
+
 def create_user(username: str, password: str, role: str):
     if not User.query.filter_by(username=username).one_or_none():
         user = User(username=username, password=password, role=role)
@@ -31,6 +72,37 @@ def create_user(username: str, password: str, role: str):
         return user
 
 
+def create_users(users: list):
+    """Create users that do not exist yet
+
+    Existing usernames are fetched in a single query, so that passwords of
+    existing users are not hashed again on every startup.
+
+    Parameters
+    ----------
+    users : list of dict
+        Users with keys `username`, `password` and `role`
+    """
+    existing_usernames = set(
+        db.session.execute(select(User.username)).scalars()
+    )
+    created_users = []
+    for user in users:
+        if user["username"] in existing_usernames:
+            continue
+        created_users.append(User(
+            username=user["username"],
+            password=user["password"],
+            role=user["role"]
+        ))
+        existing_usernames.add(user["username"])
+
+    if created_users:
+        db.session.add_all(created_users)
+        db.session.commit()
+    return created_users
+
+
 ###############################################################################
 
 
@@ -113,4 +185,299 @@ def model_to_dict(
     return data
 
 
-###############################################################################
\ No newline at end of file
+###############################################################################
+
+
+def bulk_import_rows(
+    model,
+    rows,
+    user_id: int,
+    chunk_size: int = None,
+    detail: dict = None,
+):
+    """Insert rows into a table in chunked transactions
+
+    Foreign keys are validated against the sets of existing ids of the
+    referenced tables, which are loaded once per import, instead of being
+    checked row by row, and values are converted to the types of their
+    columns. Valid rows are inserted in chunks, each chunk in its own
+    transaction; the rows of a chunk that fails are inserted one by one,
+    so that only the offending ones are rejected. A single `ChangeLog`
+    entry is written for the whole batch.
+
+    Parameters
+    ----------
+    model : SQLAlchemy model class
+        Model to insert the rows into
+    rows : iterable of dict
+        Rows as returned by `csv.DictReader`
+    user_id : int
+        ID of the user performing the import
+    chunk_size : int, optional
+        Number of rows to insert per transaction.
+        The default is None, in which case `settings.BULK_IMPORT_CHUNK_SIZE`
+        is used.
+    detail : dict, optional
+        Additional information to record in the `ChangeLog` entry.
+        The default is None.
+
+    Returns
+    -------
+    dict
+        Import report with the number of rows read, inserted and rejected,
+        the per-row errors and the per-chunk progress
+    """
+    if chunk_size is None:
+        chunk_size = settings.BULK_IMPORT_CHUNK_SIZE
+
+    columns = {column.key: column for column in class_mapper(model).columns}
+    required_columns = {
+        key
+        for key, column in columns.items()
+        if not column.nullable
+        and not column.primary_key
+        and column.default is None
+        and column.server_default is None
+    }
+
+    # preload valid ids of all referenced tables
+    foreign_key_ids = {}
+    for key, column in columns.items():
+        for foreign_key in column.foreign_keys:
+            referenced_column = foreign_key.column
+            query = select(referenced_column)
+            if "is_deleted" in referenced_column.table.columns:
+                query = query.where(
+                    referenced_column.table.columns["is_deleted"] == False  # noqa
+                )
+            foreign_key_ids[key] = set(db.session.execute(query).scalars())
+
+    report = {
+        "tablename": model.__tablename__,
+        "total": 0,
+        "inserted": 0,
+        "rejected": 0,
+        "errors": [],
+        "chunks": [],
+    }
+
+    def insert_chunk(chunk, first_line, last_line):
+        chunk_report = {
+            "index": len(report["chunks"]) + 1,
+            "lines": (first_line, last_line),
+            "rows": len(chunk),
+            "success": False,
+        }
+        try:
+            db.session.execute(insert(model), [values for _, values in chunk])
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            LOGGER.warning(
+                f"Bulk import into {model.__tablename__}: "
+                f"chunk {chunk_report['index']} failed ({e}), "
+                "inserting its rows one by one"
+            )
+            chunk_report["error"] = str(getattr(e, "orig", e))
+            # only the offending rows are rejected
+            inserted = 0
+            for line_number, values in chunk:
+                try:
+                    db.session.execute(insert(model), [values])
+                    db.session.commit()
+                except SQLAlchemyError as row_error:
+                    db.session.rollback()
+                    report["rejected"] += 1
+                    report["errors"].append(
+                        (line_number, str(getattr(row_error, "orig", row_error)))
+                    )
+                else:
+                    inserted += 1
+            report["inserted"] += inserted
+            chunk_report["inserted"] = inserted
+        else:
+            chunk_report["success"] = True
+            report["inserted"] += len(chunk)
+        report["chunks"].append(chunk_report)
+        LOGGER.info(
+            f"Bulk import into {model.__tablename__}: "
+            f"{report['inserted']} of {report['total']} rows inserted"
+        )
+
+    chunk = []
+    first_line = None
+    # line 1 is the header
+    for line_number, row in enumerate(rows, start=2):
+        report["total"] += 1
+        values = {}
+        errors = []
+        for key, value in row.items():
+            if key is None or key not in columns:
+                continue
+            if isinstance(value, str):
+                value = value.strip()
+            if key == "id" and not value:
+                continue
+            try:
+                value = convert_value(columns[key], value)
+            except (ValueError, TypeError):
+                errors.append(f"invalid value '{value}' for '{key}'")
+                continue
+            # an empty value leaves a defaulted column to its default
+            if value is None and columns[key].default is not None:
+                continue
+            values[key] = value
+
+        for key in required_columns:
+            if values.get(key) in (None, ""):
+                errors.append(f"missing value for '{key}'")
+
+        for key, valid_ids in foreign_key_ids.items():
+            if values.get(key) in (None, ""):
+                continue
+            if values[key] not in valid_ids:
+                errors.append(f"unknown {key} '{values[key]}'")
+
+        if errors:
+            report["rejected"] += 1
+            report["errors"].append((line_number, "; ".join(errors)))
+            continue
+
+        if first_line is None:
+            first_line = line_number
+        chunk.append((line_number, values))
+        if len(chunk) >= chunk_size:
+            insert_chunk(chunk, first_line, line_number)
+            chunk = []
+            first_line = None
+
+    if chunk:
+        insert_chunk(chunk, first_line, line_number)
+
+    if report["inserted"]:
+        change_detail = {"bulk_import": True}
+        change_detail.update(detail or {})
+        change_detail.update({
+            "rows": report["inserted"],
+            "rejected": report["rejected"],
+            "chunks": len(report["chunks"]),
+        })
+        db.session.add(ChangeLog(
+            user_id=user_id,
+            tablename=model.__tablename__,
+            action=ACTION_CREATE,
+            detail=json.dumps(change_detail, ensure_ascii=True)
+        ))
+        db.session.commit()
+        adjust_row_count(model, report["inserted"])
+
+    return report
+
+
+###############################################################################
+
+
+def get_row_count(model, count_query, max_age: int = None):
+    """Number of rows in a table, served from the `RowCount` table
+
+    The stored count is kept current by `adjust_row_count()` and is
+    recomputed using `count_query` when it is missing or older than
+    `max_age` seconds, to reconcile changes made outside the admin views.
+
+    Parameters
+    ----------
+    model : SQLAlchemy model class
+        Model whose rows are counted
+    count_query : SQLAlchemy query
+        Exact count query for the table
+    max_age : int, optional
+        Maximum age of the stored count in seconds.
+        The default is None, in which case
+        `settings.ADMIN_COUNT_RECONCILE_INTERVAL` is used.
+
+    Returns
+    -------
+    int
+        Number of rows
+    """
+    if max_age is None:
+        max_age = settings.ADMIN_COUNT_RECONCILE_INTERVAL
+
+    tablename = model.__tablename__
+    row_count = db.session.get(RowCount, tablename)
+    now = datetime.utcnow()
+    if (
+        row_count is not None
+        and row_count.timestamp is not None
+        and now - row_count.timestamp < timedelta(seconds=max_age)
+    ):
+        return row_count.count
+
+    count = count_query.scalar()
+    try:
+        if row_count is None:
+            db.session.add(
+                RowCount(tablename=tablename, count=count, timestamp=now)
+            )
+        else:
+            row_count.count = count
+            row_count.timestamp = now
+        db.session.commit()
+    except IntegrityError:
+        # another worker stored the count first
+        db.session.rollback()
+    return count
+
+
+def adjust_row_count(model, delta: int):
+    """Add `delta` to the stored row count of a table, if there is one"""
+    db.session.execute(
+        update(RowCount)
+        .where(RowCount.tablename == model.__tablename__)
+        .values(count=RowCount.count + delta)
+    )
+    db.session.commit()
+
+
+def get_data_version(name: str) -> int:
+    """Current version of a named piece of data (0 if it was never bumped)
+
+    A single primary key lookup, cheap enough to be polled.
+    """
+    version = db.session.execute(
+        select(DataVersion.version).where(DataVersion.name == name)
+    ).scalar()
+    return version or 0
+
+
+def bump_data_version(name: str) -> int:
+    """Increment the version of a named piece of data, to notify the other
+    workers (and hosts) that their copies of it are outdated"""
+    for _ in range(2):
+        result = db.session.execute(
+            update(DataVersion)
+            .where(DataVersion.name == name)
+            .values(version=DataVersion.version + 1)
+        )
+        if not result.rowcount:
+            db.session.add(DataVersion(name=name, version=1))
+        try:
+            db.session.commit()
+            break
+        except IntegrityError:
+            # another worker created the row first
+            db.session.rollback()
+    return get_data_version(name)
+
+
+def get_approximate_row_count(model):
+    """Estimate of the number of rows in a table using its largest id
+
+    Rows that were deleted (or soft deleted) are counted as well, but the
+    estimate is an index lookup instead of a table scan.
+    """
+    primary_key = model.__mapper__.primary_key[0]
+    return db.session.query(func.max(primary_key)).scalar() or 0
+
+
+###############################################################################
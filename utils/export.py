@@ -0,0 +1,503 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Static Site Export
+
+Prerenders the site into a directory that any static file server or CDN
+can host, e.g. for mirrors and offline workshops:
+    * the pages, as `index.html` of a directory named after their path
+      (`/team` as `team/index.html`), so that they are served as HTML,
+    * the API responses the pages use, for every category, every tag and,
+      with `--combinations N`, every selection of up to N tags,
+    * an SVG of every graph (`graphs/<category>/<id>.svg`), if Graphviz
+      (`dot`) is installed,
+    * the static assets and the uploaded publications.
+
+    $ python3 utils/export.py -o export/ -p 8
+
+Pages that require a login are exported as well, rendered (like all the
+others) for an anonymous visitor. The site must be served from the root
+of its domain, as the URLs in the pages are absolute.
+
+Exports are incremental: every output is recorded in a manifest with a
+fingerprint of the tables it is built from (and, for pages, of the
+templates, the settings they show and the asset manifest), and is only
+rendered again when one of them has changed. Outputs that are no longer
+produced (e.g. of deleted tags) are removed.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import itertools
+import subprocess
+import multiprocessing
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+###############################################################################
+
+MANIFEST_FILENAME = ".export-manifest.json"
+TEMPLATES_SOURCE = "templates"
+SETTINGS_SOURCE = "settings"
+ASSETS_SOURCE = "assets"
+PAGE_SOURCES = (TEMPLATES_SOURCE, SETTINGS_SOURCE, ASSETS_SOURCE)
+
+# settings shown in the pages
+PAGE_SETTINGS = (
+    "APP_TITLE", "APP_HEADER", "APP_SINCE", "APP_COPYRIGHT",
+    "NAVIGATION", "FOOTER_LINKS", "TEAM", "CONTACTS", "MAX_SELECT"
+)
+
+###############################################################################
+
+
+def dependency_graph_to_dot(graph: str) -> str:
+    """DOT source of a dependency graph (`id word [label head]` lines),
+    the same as the graph page renders"""
+    def quote(text: str) -> str:
+        return text.replace("\\", "\\\\").replace('"', '\\"')
+
+    relations = [
+        relation.split()
+        for relation in (graph or "").strip().splitlines()
+        if relation.strip()
+    ]
+    dot = ["digraph G {"]
+    for words in relations:
+        label = words[1] if len(words) > 1 else ""
+        dot.append(f'n{words[0]} [label="{quote(label)}"];')
+    for words in relations:
+        if len(words) < 4:
+            continue
+        dot.append(
+            f'n{words[3]} -> n{words[0]} '
+            f'[label="{quote(words[2])}", dir="back"];'
+        )
+    dot.append("}")
+    return "\n".join(dot)
+
+
+def output_path(url_path: str, page: bool = False) -> str:
+    """Relative file path of a URL path
+
+    Pages without an extension (`/team`) are written as the `index.html`
+    of a directory, which static servers deliver as HTML.
+    """
+    path = url_path.lstrip("/")
+    if page and path and not path.endswith("/") and "." not in (
+        path.rsplit("/", 1)[-1]
+    ):
+        path += "/"
+    if not path or path.endswith("/"):
+        path += "index.html"
+    return path
+
+
+def write_file(filepath: str, content: bytes):
+    """Write a file atomically, so that a served file is never partial"""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    temporary_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+    os.replace(temporary_path, filepath)
+
+
+def copy_tree(source_dir: str, target_dir: str) -> int:
+    """Copy the files of `source_dir` that are missing or differ (by size
+    or modification time) in `target_dir`"""
+    copied = 0
+    for directory, _, filenames in os.walk(source_dir):
+        for filename in filenames:
+            source = os.path.join(directory, filename)
+            target = os.path.join(
+                target_dir, os.path.relpath(source, source_dir)
+            )
+            copied += copy_file(source, target)
+    return copied
+
+
+def copy_file(source: str, target: str) -> bool:
+    source_stat = os.stat(source)
+    try:
+        target_stat = os.stat(target)
+        if (
+            target_stat.st_size == source_stat.st_size
+            and int(target_stat.st_mtime) == int(source_stat.st_mtime)
+        ):
+            return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copy2(source, target)
+    return True
+
+
+###############################################################################
+# Fingerprints
+
+
+def table_fingerprint(db, table) -> str:
+    digest = hashlib.sha1()
+    rows = db.session.execute(
+        table.select().order_by(*table.primary_key.columns)
+    )
+    for row in rows:
+        digest.update(repr(tuple(row)).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def directory_fingerprint(directory: str) -> str:
+    digest = hashlib.sha1()
+    for path, _, filenames in sorted(os.walk(directory)):
+        for filename in sorted(filenames):
+            filepath = os.path.join(path, filename)
+            digest.update(os.path.relpath(filepath, directory).encode())
+            with open(filepath, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def file_fingerprint(filepath: str) -> str:
+    digest = hashlib.sha1()
+    if os.path.isfile(filepath):
+        with open(filepath, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def settings_fingerprint(names: tuple) -> str:
+    import settings
+
+    return hashlib.sha1(repr([
+        (name, getattr(settings, name, None)) for name in names
+    ]).encode("utf-8")).hexdigest()
+
+
+def sources_fingerprint(fingerprints: dict, sources: tuple) -> str:
+    return hashlib.sha1("|".join(
+        f"{source}:{fingerprints[source]}" for source in sorted(sources)
+    ).encode()).hexdigest()
+
+
+###############################################################################
+# Tasks
+
+
+def collect_tasks(app, combinations: int = 1, graphs: bool = True) -> tuple:
+    """Outputs to produce and the fingerprints of their sources
+
+    Returns
+    -------
+    tuple
+        (tasks, fingerprints), where every task is a tuple
+        (kind, output path, argument, sources); `kind` is "page" (the
+        argument being a URL path) or "graph" (the argument being DOT)
+    """
+    from flask import url_for
+
+    from models import (
+        db, Language, TagInformation, Publication,
+        TAG_MODEL_MAP, GRAPH_MODEL_MAP
+    )
+    from utils.tagset import TAGSET
+    from utils.assets import DIST_DIR, MANIFEST_FILENAME as ASSETS_MANIFEST
+
+    def tables(*models):
+        return tuple(model.__tablename__ for model in models)
+
+    tag_models = [model for models in TAG_MODEL_MAP.values() for model in models]
+    fingerprints = {
+        model.__tablename__: table_fingerprint(db, model.__table__)
+        for model in [Language, TagInformation, Publication]
+        + tag_models + list(GRAPH_MODEL_MAP.values())
+    }
+    fingerprints[TEMPLATES_SOURCE] = directory_fingerprint(
+        os.path.join(app.root_path, app.template_folder)
+    )
+    fingerprints[SETTINGS_SOURCE] = settings_fingerprint(PAGE_SETTINGS)
+    fingerprints[ASSETS_SOURCE] = file_fingerprint(
+        os.path.join(app.static_folder, DIST_DIR, ASSETS_MANIFEST)
+    )
+
+    tasks = []
+
+    def add_page(sources, endpoint, page=False, **values):
+        url_path = url_for(endpoint, **values)
+        tasks.append(("page", output_path(url_path, page), url_path, sources))
+
+    with app.test_request_context():
+        tagset = TAGSET.get()
+        for endpoint in [
+            "show_home", "show_terms", "show_team", "show_contact",
+            "show_tag", "show_graph"
+        ]:
+            add_page(PAGE_SOURCES, endpoint, page=True)
+        add_page(
+            (*PAGE_SOURCES, *tables(Publication)), "list_publications",
+            page=True
+        )
+        add_page(tables(Publication), "list_publications_bibtex")
+        add_page(tables(Language), "list_languages")
+        add_page(tables(TagInformation, *tag_models), "list_tags")
+
+        for name, (model_tag, model_data) in TAG_MODEL_MAP.items():
+            sources = tables(Language, model_tag, model_data)
+            add_page(tables(model_tag), "list_category_tags", tag_category=name)
+            # selections are in the order of the tag list (by code)
+            tags = tagset.categories[name].tags
+            for size in range(1, combinations + 1):
+                for selection in itertools.combinations(tags, size):
+                    tag_ids = ",".join(str(tag.id) for tag in selection)
+                    for endpoint in ["get_category_tags", "get_category_pivot"]:
+                        add_page(
+                            sources, endpoint,
+                            tag_category=name, tag_ids=tag_ids
+                        )
+
+        for name, model_graph in GRAPH_MODEL_MAP.items():
+            sources = tables(Language, model_graph)
+            add_page(sources, "get_category_graphs", graph_category=name)
+            if not graphs:
+                continue
+            rows = db.session.execute(
+                db.select(model_graph.id, model_graph.graph).where(
+                    model_graph.is_deleted == False  # noqa
+                )
+            )
+            for graph_id, graph in rows:
+                tasks.append((
+                    "graph",
+                    f"graphs/{name}/{graph_id}.svg",
+                    dependency_graph_to_dot(graph),
+                    tables(model_graph)
+                ))
+
+    return tasks, fingerprints
+
+
+###############################################################################
+# Rendering
+
+
+_WORKER = {}
+
+
+def init_worker(output_dir: str):
+    # already imported when the worker is forked
+    import server
+    from models import db
+
+    _WORKER["app"] = server.webapp
+    _WORKER["output_dir"] = output_dir
+    # connections inherited from the parent must not be shared
+    with server.webapp.app_context():
+        db.engine.dispose(close=False)
+
+
+def render_page(app, url_path: str) -> bytes:
+    """Body of the response to a GET request for `url_path`
+
+    The view is called directly, skipping `login_required` (and the
+    request hooks), as the export is public.
+    """
+    from flask import request
+
+    with app.test_request_context(url_path):
+        view = app.view_functions[request.url_rule.endpoint]
+        view = getattr(view, "__wrapped__", view)
+        response = app.make_response(view(**request.view_args))
+        if response.status_code != 200:
+            raise ValueError(f"HTTP {response.status_code}")
+        return response.get_data()
+
+
+def render_graph(dot: str) -> bytes:
+    return subprocess.run(
+        ["dot", "-Tsvg"], input=dot.encode("utf-8"),
+        capture_output=True, check=True, timeout=60
+    ).stdout
+
+
+def render_task(task: tuple) -> tuple:
+    """Render one output; returns (output path, error message or None)"""
+    kind, path, argument, _ = task
+    try:
+        if kind == "page":
+            content = render_page(_WORKER["app"], argument)
+        else:
+            content = render_graph(argument)
+        write_file(os.path.join(_WORKER["output_dir"], path), content)
+    except Exception as e:
+        return path, f"{type(e).__name__}: {e}"
+    return path, None
+
+
+###############################################################################
+
+
+def export(app, output_dir: str, processes: int = None,
+           combinations: int = 1, force: bool = False) -> dict:
+    """Export the site to `output_dir`
+
+    `app` is the application of `server`, which the workers import.
+
+    Returns
+    -------
+    dict
+        Numbers of rendered, unchanged, failed and removed outputs and of
+        copied files, and the errors
+    """
+    output_dir = os.path.abspath(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_FILENAME)
+    manifest = {}
+    if not force and os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    graphs = shutil.which("dot") is not None
+    if not graphs:
+        LOGGER.warning("Graphviz (dot) is not installed, skipping graph SVGs.")
+
+    with app.app_context():
+        tasks, fingerprints = collect_tasks(app, combinations, graphs)
+
+        from models import Publication
+        publication_files = [
+            filename for (filename,) in Publication.query.filter(
+                Publication.is_visible == True,  # noqa
+                Publication.is_deleted == False,  # noqa
+                Publication.filename.isnot(None)
+            ).with_entities(Publication.filename)
+        ]
+
+    outputs = {
+        path: sources_fingerprint(fingerprints, sources)
+        for _, path, _, sources in tasks
+    }
+    stale_tasks = [
+        task for task in tasks
+        if manifest.get(task[1]) != outputs[task[1]]
+        or not os.path.isfile(os.path.join(output_dir, task[1]))
+    ]
+
+    # before rendering, as an output may be replaced by a directory
+    # (e.g. `team` by `team/index.html`)
+    removed = 0
+    for path in set(manifest) - set(outputs):
+        try:
+            os.remove(os.path.join(output_dir, path))
+            removed += 1
+        except FileNotFoundError:
+            pass
+
+    errors = {}
+    if stale_tasks:
+        if processes == 1:
+            init_worker(output_dir)
+            results = map(render_task, stale_tasks)
+        else:
+            pool = multiprocessing.Pool(
+                processes, initializer=init_worker, initargs=(output_dir,)
+            )
+            results = pool.imap_unordered(render_task, stale_tasks, 16)
+        for path, error in results:
+            if error is not None:
+                errors[path] = error
+                outputs.pop(path)
+        if processes != 1:
+            pool.close()
+            pool.join()
+
+    write_file(
+        manifest_path,
+        json.dumps(outputs, indent=1, sort_keys=True).encode("utf-8")
+    )
+
+    copied = copy_tree(
+        app.static_folder,
+        os.path.join(output_dir, app.static_url_path.lstrip("/"))
+    )
+    upload_dir = app.config["UPLOAD_FOLDER"]
+    for filename in publication_files:
+        source = os.path.join(upload_dir, filename)
+        if os.path.isfile(source):
+            copied += copy_file(
+                source, os.path.join(output_dir, "publications", filename)
+            )
+
+    return {
+        "rendered": len(stale_tasks) - len(errors),
+        "unchanged": len(tasks) - len(stale_tasks),
+        "failed": len(errors),
+        "removed": removed,
+        "copied": copied,
+        "errors": errors,
+    }
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    import argparse
+
+    sys.path.insert(
+        0, os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    )
+
+    parser = argparse.ArgumentParser(description="Export a static site")
+    parser.add_argument(
+        "-o", "--output", default="export",
+        help="Output directory (default: export)"
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=None,
+        help="Number of worker processes (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "-c", "--combinations", type=int, default=1,
+        help="Export the API responses of selections of up to this many "
+             "tags (default: 1)"
+    )
+    parser.add_argument(
+        "-f", "--force", action="store_true",
+        help="Render every output, even if its sources have not changed"
+    )
+    args = vars(parser.parse_args())
+
+    logging.basicConfig(level=logging.WARNING)
+
+    import server
+    from utils.tagset import TAGSET
+
+    # the snapshot loaded by the server is shared with the workers
+    TAGSET.poll_interval = None
+
+    _summary = export(
+        server.webapp, args["output"],
+        processes=args["processes"],
+        combinations=args["combinations"],
+        force=args["force"]
+    )
+    for _path, _error in sorted(_summary["errors"].items()):
+        print(f"{_path}\t{_error}", file=sys.stderr)
+    print(
+        f"{_summary['rendered']} rendered, {_summary['unchanged']} unchanged, "
+        f"{_summary['failed']} failed, {_summary['removed']} removed, "
+        f"{_summary['copied']} files copied",
+        file=sys.stderr
+    )
+    sys.exit(1 if _summary["failed"] else 0)
+
+###############################################################################
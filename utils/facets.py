@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Faceted Tag Index
+
+Indexes the meta fields declared for a category in `TAG_SCHEMA` as
+bitmaps (Python integers, bit `i` standing for the `i`-th tag of the
+category), so that any combination of filters, and the number of tags for
+every value of every field, are answered with a few bitwise operations:
+
+    index = get_facet_indexes(TAGSET.get())["tense_aspect_mood_tag"]
+    index.search({"tense_tag": ["bhuta"], "aspect_tag": ["purna"]})
+
+Indexes are built once per tagset snapshot, for every category with meta
+fields; a column added to a model and declared in its schema is indexed
+as well.
+
+Comma-separated values (e.g. `aspect_tag`: "apurna, avadhi") are indexed
+separately, and empty values as `MISSING`. Values of one field are
+combined with OR, fields with AND.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import functools
+
+###############################################################################
+
+MISSING = "---"
+
+# columns that identify a tag rather than describe it
+IDENTITY_FIELDS = {
+    "id", "code", "tag", "name", "english_name", "description", "is_deleted"
+}
+
+TAM_CATEGORY = "tense_aspect_mood_tag"
+# fields holding the parts of a TAM tag (e.g. "K-bhuta, P-purna")
+TAM_PARTS = ("tense_tag", "aspect_tag", "mood_tag")
+
+###############################################################################
+
+
+def split_values(value) -> tuple:
+    value = "" if value is None else str(value)
+    values = tuple(dict.fromkeys(
+        part.strip() for part in value.split(",") if part.strip()
+    ))
+    return values or (MISSING,)
+
+
+def get_facet_fields(schema: dict) -> dict:
+    """Meta fields declared in a `TAG_SCHEMA` entry (field -> label)"""
+    return {
+        field: label
+        for field, label in schema.get("meta", {}).items()
+        if field not in IDENTITY_FIELDS
+    }
+
+
+def iter_bits(bitmap: int):
+    """Positions of the set bits, in increasing order"""
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield lowest.bit_length() - 1
+        bitmap ^= lowest
+
+
+###############################################################################
+
+
+class FacetIndex:
+    """Bitmaps of the values of the fields of a list of tags
+
+    Parameters
+    ----------
+    tags : tuple
+        Tag records
+    fields : dict
+        Fields to index -> their labels
+    """
+
+    def __init__(self, tags: tuple, fields: dict):
+        self.tags = tags
+        self.fields = dict(fields)
+        self.all = (1 << len(tags)) - 1
+        # field -> value -> bitmap
+        self.bitmaps = {field: {} for field in self.fields}
+        # position -> field -> values
+        self.values = []
+        # code or tag -> position
+        self.positions = {}
+
+        for position, tag in enumerate(tags):
+            bit = 1 << position
+            tag_values = {}
+            for field in self.fields:
+                values = split_values(getattr(tag, field, None))
+                tag_values[field] = values
+                bitmaps = self.bitmaps[field]
+                for value in values:
+                    bitmaps[value] = bitmaps.get(value, 0) | bit
+            self.values.append(tag_values)
+            self.positions.setdefault(tag.code, position)
+            if tag.tag:
+                self.positions.setdefault(tag.tag.strip(), position)
+
+    # ----------------------------------------------------------------------- #
+
+    def match(self, filters: dict, exclude: str = None) -> int:
+        """Bitmap of the tags matching `filters` (field -> values)
+
+        Raises
+        ------
+        KeyError
+            If a field is not indexed
+        """
+        bitmap = self.all
+        for field, values in filters.items():
+            if field == exclude:
+                continue
+            bitmaps = self.bitmaps[field]
+            field_bitmap = 0
+            for value in values:
+                field_bitmap |= bitmaps.get(value, 0)
+            bitmap &= field_bitmap
+        return bitmap
+
+    def select(self, bitmap: int) -> list:
+        return [self.tags[position] for position in iter_bits(bitmap)]
+
+    def counts(self, filters: dict) -> dict:
+        """Number of matching tags for every value of every field
+
+        The counts of a field ignore the filter on that field itself, so
+        that they tell how many tags another value of it would add.
+        """
+        counts = {}
+        for field, bitmaps in self.bitmaps.items():
+            bitmap = self.match(filters, exclude=field)
+            field_counts = {}
+            for value, value_bitmap in bitmaps.items():
+                count = (value_bitmap & bitmap).bit_count()
+                if count:
+                    field_counts[value] = count
+            counts[field] = field_counts
+        return counts
+
+    def search(self, filters: dict, tags: bool = True) -> dict:
+        bitmap = self.match(filters)
+        response = {
+            "fields": self.fields,
+            "count": bitmap.bit_count(),
+            "facets": self.counts(filters),
+        }
+        if tags:
+            response["tags"] = [tag.to_dict() for tag in self.select(bitmap)]
+        return response
+
+    # ----------------------------------------------------------------------- #
+
+    def get_position(self, tag: str) -> int:
+        """Position of a tag, given by its code or tag"""
+        return self.positions.get(tag.strip())
+
+
+###############################################################################
+# TAM Tags
+
+
+def decompose_tam(index: FacetIndex, tag: str) -> dict:
+    """Parts of a TAM tag, given by its code or tag"""
+    position = index.get_position(tag)
+    if position is None:
+        return None
+    values = index.values[position]
+    return {
+        "tag": index.tags[position].to_dict(),
+        "parts": {
+            field: [value for value in values[field] if value != MISSING]
+            for field in TAM_PARTS
+        },
+        "facets": {
+            field: list(values[field])
+            for field in index.fields if field not in TAM_PARTS
+        },
+    }
+
+
+def compose_tam(index: FacetIndex, parts: dict) -> dict:
+    """TAM tags made of the given parts (field -> values)
+
+    Tags having exactly these parts (and no others) are `exact`, tags
+    having at least these parts are `partial`.
+    """
+    bitmap = index.all
+    for field, values in parts.items():
+        for value in values:
+            bitmap &= index.bitmaps[field].get(value, 0)
+    exact = []
+    partial = []
+    for position in iter_bits(bitmap):
+        values = index.values[position]
+        tag = index.tags[position].to_dict()
+        if all(
+            set(values[field]) == set(parts.get(field) or (MISSING,))
+            for field in TAM_PARTS
+        ):
+            exact.append(tag)
+        else:
+            partial.append(tag)
+    return {"exact": exact, "partial": partial}
+
+
+###############################################################################
+
+
+@functools.lru_cache(maxsize=1)
+def get_facet_indexes(tagset) -> dict:
+    """Facet indexes of the categories declaring meta fields in their
+    schema, built once per tagset snapshot"""
+    indexes = {}
+    for name, category in tagset.categories.items():
+        fields = get_facet_fields(category.schema)
+        if fields:
+            indexes[name] = FacetIndex(category.tags, fields)
+    return indexes
+
+
+###############################################################################
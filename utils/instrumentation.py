@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SQL Instrumentation
+
+Counts and times the SQL statements executed by every request, using the
+SQLAlchemy engine events, and
+    * adds `X-SQL-Statements`, `X-SQL-Time` and `Server-Timing` headers
+      to the response,
+    * logs statements slower than a threshold along with their endpoint,
+    * aggregates per-endpoint histograms of statement counts and DB time.
+
+The event listeners are only registered, on the engines of the application,
+when `SQLInstrumentation` is created, so there is no cost when it is not
+enabled.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import time
+import bisect
+import logging
+import threading
+
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+###############################################################################
+
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+TIME_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)  # ms
+
+###############################################################################
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds (plus `+Inf`)"""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        # [upper bound, cumulative count] pairs, as JSON objects get sorted
+        cumulative = 0
+        buckets = []
+        for bound, count in zip(self.buckets + ("+Inf",), self.counts):
+            cumulative += count
+            buckets.append([bound, cumulative])
+        return {"count": self.count, "sum": self.sum, "buckets": buckets}
+
+
+class SQLInstrumentation:
+    """Per-request SQL statement count and time
+
+    Parameters
+    ----------
+    app : Flask, optional
+        Flask application
+    slow_query_threshold : float, optional
+        Statements that take longer (in seconds) are logged.
+        The default is 0.1.
+    headers : bool, optional
+        Add the statement count and time to the response headers.
+        The default is True.
+    """
+
+    def __init__(self, app=None, slow_query_threshold: float = 0.1,
+                 headers: bool = True):
+        self.slow_query_threshold = slow_query_threshold
+        self.headers = headers
+        self.histograms = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        # engines of Flask-SQLAlchemy, which has to be initialized first
+        with app.app_context():
+            engines = list(app.extensions["sqlalchemy"].engines.values())
+        for engine in engines:
+            event.listen(engine, "before_cursor_execute", self.before_execute)
+            event.listen(engine, "after_cursor_execute", self.after_execute)
+            event.listen(engine, "handle_error", self.handle_error)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.extensions["sql_instrumentation"] = self
+
+    # ----------------------------------------------------------------------- #
+    # Engine Events
+
+    def before_execute(self, conn, cursor, statement, parameters, context,
+                       executemany):
+        conn.info.setdefault("query_start_time", []).append(
+            time.perf_counter()
+        )
+
+    def after_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        if not has_request_context():
+            return
+
+        g.sql_statements = g.get("sql_statements", 0) + 1
+        g.sql_time = g.get("sql_time", 0) + elapsed
+        if elapsed > self.slow_query_threshold:
+            LOGGER.warning(
+                f"Slow query ({elapsed * 1000:.1f} ms) in "
+                f"{request.endpoint}: {statement}"
+            )
+
+    def handle_error(self, exception_context):
+        # a failed statement gets no `after_cursor_execute`
+        conn = exception_context.connection
+        if conn is None or exception_context.execution_context is None:
+            return
+        start_times = conn.info.get("query_start_time")
+        if start_times:
+            start_times.pop()
+
+    # ----------------------------------------------------------------------- #
+    # Request Hooks
+
+    def start_request(self):
+        g.sql_statements = 0
+        g.sql_time = 0
+
+    def finish_request(self, response):
+        statements = g.get("sql_statements", 0)
+        time_ms = g.get("sql_time", 0) * 1000
+
+        if self.headers:
+            response.headers["X-SQL-Statements"] = str(statements)
+            response.headers["X-SQL-Time"] = f"{time_ms:.3f}"
+            response.headers.add(
+                "Server-Timing",
+                f'db;dur={time_ms:.3f};desc="{statements} statements"'
+            )
+
+        endpoint = request.endpoint or "<unknown>"
+        with self.lock:
+            if endpoint not in self.histograms:
+                self.histograms[endpoint] = {
+                    "statements": Histogram(STATEMENT_BUCKETS),
+                    "time_ms": Histogram(TIME_BUCKETS),
+                }
+            self.histograms[endpoint]["statements"].observe(statements)
+            self.histograms[endpoint]["time_ms"].observe(time_ms)
+        return response
+
+    # ----------------------------------------------------------------------- #
+
+    def summary(self) -> dict:
+        """Per-endpoint histograms of statement counts and DB time (ms)"""
+        with self.lock:
+            return {
+                endpoint: {
+                    name: histogram.to_dict()
+                    for name, histogram in histograms.items()
+                }
+                for endpoint, histograms in sorted(self.histograms.items())
+            }
+
+
+###############################################################################
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus Metrics
+
+Serves `/metrics` in the Prometheus text format with
+    * request counts and latency histograms per endpoint,
+    * DB time per endpoint (from `SQLInstrumentation`),
+    * cache hits and misses of the in-process caches,
+    * rate limiter rejections per endpoint,
+    * startup (database seeding included) duration and worker memory.
+
+Requires `prometheus_client`; without it, no metrics are collected and
+`/metrics` is not registered.
+
+Multiple Workers
+----------------
+When the application runs in several worker processes, each of them only
+sees its own requests. Setting `METRICS_MULTIPROC_DIR` (or the
+`PROMETHEUS_MULTIPROC_DIR` environment variable) makes every worker write
+its values to memory-mapped files in that directory, which are aggregated
+by whichever worker serves `/metrics`. The directory has to be emptied
+when the server starts, and the files of exited workers marked dead, e.g.
+in `gunicorn.conf.py`:
+
+    from utils.metrics import clear_multiprocess_dir, mark_process_dead
+
+    def on_starting(server):
+        clear_multiprocess_dir()
+
+    def child_exit(server, worker):
+        mark_process_dead(worker.pid)
+
+Access to `/metrics` should be restricted at the front-end server, e.g.
+    location /metrics { allow 10.0.0.0/8; deny all; }
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import time
+import shutil
+import logging
+import resource
+import threading
+
+from flask import g, request, Response
+
+import settings
+
+# must be set before `prometheus_client` is imported
+if settings.METRICS_MULTIPROC_DIR:
+    os.environ.setdefault(
+        "PROMETHEUS_MULTIPROC_DIR", settings.METRICS_MULTIPROC_DIR
+    )
+MULTIPROC_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+###############################################################################
+
+PREFIX = "samanvaya"
+MEMORY_UPDATE_INTERVAL = 10  # seconds
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+###############################################################################
+
+
+def clear_multiprocess_dir():
+    """Remove the values left behind by a previous run (call before the
+    workers are started)"""
+    if MULTIPROC_DIR and os.path.isdir(MULTIPROC_DIR):
+        shutil.rmtree(MULTIPROC_DIR)
+        os.makedirs(MULTIPROC_DIR)
+
+
+def mark_process_dead(pid: int):
+    """Drop the live gauges of an exited worker"""
+    if prometheus_client is not None and MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
+
+
+def get_resident_memory() -> int:
+    """Resident memory of the current process in bytes"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # peak, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+###############################################################################
+
+
+class Metrics:
+    """Collect request metrics and serve them at `/metrics`
+
+    Parameters
+    ----------
+    app : Flask, optional
+        Flask application
+    caches : dict, optional
+        Name -> `TTLCache` whose hits and misses are reported
+    """
+
+    def __init__(self, app=None, caches: dict = None):
+        self.caches = caches or {}
+        self.enabled = prometheus_client is not None
+        self._cache_counts = {}
+        self._memory_updated = 0
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            self._create_metrics()
+        else:
+            LOGGER.warning("prometheus_client is not installed, metrics are disabled.")
+
+        if app is not None:
+            self.init_app(app)
+
+    def _create_metrics(self):
+        Counter = prometheus_client.Counter
+        Gauge = prometheus_client.Gauge
+        Histogram = prometheus_client.Histogram
+
+        self.requests = Counter(
+            f"{PREFIX}_http_requests_total",
+            "Number of HTTP requests",
+            ["endpoint", "method", "status"]
+        )
+        self.latency = Histogram(
+            f"{PREFIX}_http_request_duration_seconds",
+            "Time taken to handle a request",
+            ["endpoint"],
+            buckets=LATENCY_BUCKETS
+        )
+        self.db_time = Histogram(
+            f"{PREFIX}_db_duration_seconds",
+            "Time spent in SQL statements per request",
+            ["endpoint"],
+            buckets=LATENCY_BUCKETS
+        )
+        self.cache_requests = Counter(
+            f"{PREFIX}_cache_requests_total",
+            "Number of in-process cache lookups",
+            ["cache", "result"]
+        )
+        self.rate_limited = Counter(
+            f"{PREFIX}_rate_limit_rejections_total",
+            "Number of requests rejected by the rate limiter",
+            ["endpoint"]
+        )
+        self.startup_duration = Gauge(
+            f"{PREFIX}_startup_duration_seconds",
+            "Time taken to start a worker, including database seeding",
+            multiprocess_mode="max"
+        )
+        self.memory = Gauge(
+            f"{PREFIX}_worker_resident_memory_bytes",
+            "Resident memory of a worker process",
+            multiprocess_mode="liveall"
+        )
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.add_url_rule("/metrics", "metrics", self.show_metrics)
+        app.extensions["metrics"] = self
+
+    # ----------------------------------------------------------------------- #
+
+    def set_startup_duration(self, seconds: float):
+        if self.enabled:
+            self.startup_duration.set(seconds)
+
+    def update_cache_counts(self):
+        with self._lock:
+            for name, cache in self.caches.items():
+                last_hits, last_misses = self._cache_counts.get(name, (0, 0))
+                hits, misses = cache.hits, cache.misses
+                if hits > last_hits:
+                    self.cache_requests.labels(name, "hit").inc(hits - last_hits)
+                if misses > last_misses:
+                    self.cache_requests.labels(name, "miss").inc(misses - last_misses)
+                self._cache_counts[name] = (hits, misses)
+
+    def update_memory(self, force: bool = False):
+        now = time.monotonic()
+        if force or now - self._memory_updated > MEMORY_UPDATE_INTERVAL:
+            self._memory_updated = now
+            self.memory.set(get_resident_memory())
+
+    # ----------------------------------------------------------------------- #
+    # Request Hooks
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+
+    def finish_request(self, response):
+        endpoint = request.endpoint or "<unknown>"
+        self.requests.labels(
+            endpoint, request.method, str(response.status_code)
+        ).inc()
+
+        start = g.get("metrics_start")
+        if start is not None:
+            self.latency.labels(endpoint).observe(time.perf_counter() - start)
+        sql_time = g.get("sql_time")
+        if sql_time is not None:
+            self.db_time.labels(endpoint).observe(sql_time)
+        if response.status_code == 429:
+            self.rate_limited.labels(endpoint).inc()
+
+        self.update_cache_counts()
+        self.update_memory()
+        return response
+
+    # ----------------------------------------------------------------------- #
+
+    def show_metrics(self):
+        self.update_cache_counts()
+        self.update_memory(force=True)
+
+        if MULTIPROC_DIR:
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = prometheus_client.REGISTRY
+        return Response(
+            prometheus_client.generate_latest(registry),
+            content_type=prometheus_client.CONTENT_TYPE_LATEST
+        )
+
+
+###############################################################################
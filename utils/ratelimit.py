@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared Rate Limiter Storage
+
+`memory://` storage keeps separate counters in every worker process, so
+with N workers the effective limit is N times the configured one, and it
+is reset whenever a worker restarts. `SQLiteStorage` keeps the counters
+in an SQLite database (in WAL mode, without a sync on every commit) that
+all workers on a host share:
+
+    Limiter(..., storage_uri="sqlite:////path/to/limits.db",
+            strategy="sliding-window-counter")
+
+Importing this module registers the `sqlite://` scheme with `limits`.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import math
+import time
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from limits.storage import Storage, SlidingWindowCounterSupport
+
+###############################################################################
+
+# remove expired counters every so many writes (per process)
+PURGE_INTERVAL = 1000
+
+###############################################################################
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport):
+    """Rate limit counters shared through an SQLite database
+
+    Supports the fixed window and sliding window counter strategies.
+    Every counter is a row with an absolute expiry time; the sliding
+    window is the current and the previous fixed window, read and
+    incremented in one transaction.
+    """
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False,
+                 timeout: float = 5.0, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = uri[len("sqlite:///"):]
+        self.timeout = timeout
+        self._local = threading.local()
+        self._writes = 0
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with self._transaction() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "key TEXT PRIMARY KEY, "
+                "count INTEGER NOT NULL, "
+                "expiry REAL NOT NULL"
+                ") WITHOUT ROWID"
+            )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    # ----------------------------------------------------------------------- #
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """Connection of the current thread (and process)"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(
+                self.path, timeout=self.timeout, isolation_level=None,
+                check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self.connection
+        # take the write lock up front, so that read-modify-write is atomic
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        else:
+            connection.execute("COMMIT")
+
+        self._writes += 1
+        if self._writes % PURGE_INTERVAL == 0:
+            connection.execute(
+                "DELETE FROM counters WHERE expiry <= ?", (time.time(),)
+            )
+
+    @staticmethod
+    def _get(connection, key: str, now: float) -> int:
+        row = connection.execute(
+            "SELECT count FROM counters WHERE key = ? AND expiry > ?",
+            (key, now)
+        ).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _incr(connection, key: str, expiry_at: float, amount: int,
+              now: float) -> int:
+        return connection.execute(
+            "INSERT INTO counters (key, count, expiry) VALUES (?, ?, ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "count = CASE WHEN expiry <= ? "
+            "THEN excluded.count ELSE count + excluded.count END, "
+            "expiry = CASE WHEN expiry <= ? "
+            "THEN excluded.expiry ELSE expiry END "
+            "RETURNING count",
+            (key, amount, expiry_at, now, now)
+        ).fetchone()[0]
+
+    # ----------------------------------------------------------------------- #
+    # Fixed Window
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        with self._transaction() as connection:
+            return self._incr(connection, key, now + expiry, amount, now)
+
+    def get(self, key: str) -> int:
+        return self._get(self.connection, key, time.time())
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self.connection.execute(
+            "SELECT expiry FROM counters WHERE key = ? AND expiry > ?",
+            (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self) -> bool:
+        try:
+            self.connection.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        with self._transaction() as connection:
+            return connection.execute("DELETE FROM counters").rowcount
+
+    def clear(self, key: str) -> None:
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM counters WHERE key = ?", (key,))
+
+    # ----------------------------------------------------------------------- #
+    # Sliding Window Counter
+
+    @staticmethod
+    def _window_keys(key: str, expiry: int, now: float):
+        window = int(now // expiry)
+        return window, f"{key}/{window - 1}", f"{key}/{window}"
+
+    def _sliding_window(self, connection, key: str, expiry: int, now: float):
+        window, previous_key, current_key = self._window_keys(key, expiry, now)
+        previous_count = self._get(connection, previous_key, now)
+        current_count = self._get(connection, current_key, now)
+        # share of the previous window still inside the sliding window
+        previous_ttl = (
+            expiry - (now - window * expiry) if previous_count else 0.0
+        )
+        current_ttl = (window + 2) * expiry - now
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int,
+                                     amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        with self._transaction() as connection:
+            previous_count, previous_ttl, current_count, _ = (
+                self._sliding_window(connection, key, expiry, now)
+            )
+            weighted_count = (
+                previous_count * previous_ttl / expiry + current_count
+            )
+            if math.floor(weighted_count) + amount > limit:
+                return False
+            window, _, current_key = self._window_keys(key, expiry, now)
+            # kept for two windows, to serve as the next previous window
+            self._incr(
+                connection, current_key, (window + 2) * expiry, amount, now
+            )
+            return True
+
+    def get_sliding_window(self, key: str, expiry: int):
+        return self._sliding_window(self.connection, key, expiry, time.time())
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        _, previous_key, current_key = self._window_keys(
+            key, expiry, time.time()
+        )
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM counters WHERE key IN (?, ?)",
+                (previous_key, current_key)
+            )
+
+
+###############################################################################
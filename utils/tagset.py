@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-Memory Tagset
+
+A compact, read-only snapshot of the languages, tag information and the
+tags of all categories of `TAG_MODEL_MAP`, with lookup tables by id and
+code, so that public API reads do not touch SQLAlchemy. Examples, which
+outnumber the tags by far, are not part of the snapshot: those of a tag
+are loaded when first requested and kept in a bounded cache of the
+snapshot (see `Category.get_data()`).
+
+Rows are instances of `__slots__` classes, one per table. The snapshot is
+built once at startup, before the workers are forked, and replaced as a
+whole (a single reference assignment) when its version in the database
+changes (see `TagsetStore`).
+Readers should hold on to one snapshot for the duration of a request:
+
+    tagset = TAGSET.get()
+    tags = tagset.categories["voice_tag"].tags
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import os
+import time
+import logging
+import functools
+import threading
+from types import MappingProxyType
+
+from sqlalchemy import select
+from sqlalchemy.orm import class_mapper
+
+import settings
+from models import db, Language, TagInformation, TAG_MODEL_MAP, TAG_SCHEMA
+from utils.database import get_data_version, bump_data_version
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+# name of the `DataVersion` row of the tagset
+TAGSET_VERSION = "tagset"
+
+###############################################################################
+
+
+class Frozen:
+    """Base for objects whose attributes cannot be changed once set"""
+
+    __slots__ = ()
+
+    def __init__(self, **kwargs):
+        for name, value in kwargs.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+
+class Record(Frozen):
+    """Read-only table row with the columns as slots"""
+
+    __slots__ = ()
+    _fields = ()
+
+    def __init__(self, values):
+        for name, value in zip(self._fields, values):
+            object.__setattr__(self, name, value)
+
+    def to_dict(self) -> dict:
+        """Same as `model_to_dict` of the corresponding model object"""
+        return {name: getattr(self, name) for name in self._fields}
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {getattr(self, 'id', None)}>"
+
+
+def record_class(model) -> type:
+    fields = tuple(column.key for column in class_mapper(model).columns)
+    return type(
+        f"{model.__name__}Record",
+        (Record,),
+        {"__slots__": fields, "_fields": fields}
+    )
+
+
+RECORD_CLASSES = {
+    model: record_class(model)
+    for model in [Language, TagInformation] + [
+        model for models in TAG_MODEL_MAP.values() for model in models
+    ]
+}
+
+###############################################################################
+
+
+class Category(Frozen):
+    """Tags of one category, sorted by code, and their examples
+
+    Parameters
+    ----------
+    data_cache_size : int, optional
+        Number of tags whose examples are kept in memory.
+        The default is None, in which case `settings.TAGSET_DATA_CACHE_SIZE`
+        is used.
+    """
+
+    __slots__ = (
+        "name", "schema", "model_data", "tags", "tags_by_id", "tags_by_code",
+        "_load_data"
+    )
+
+    def __init__(self, data_cache_size: int = None, **kwargs):
+        if data_cache_size is None:
+            data_cache_size = settings.TAGSET_DATA_CACHE_SIZE
+        # not a bound method, which would make a reference cycle that keeps
+        # snapshots frozen by `gc.freeze()` alive after they are replaced
+        load_data = functools.partial(load_tag_data, kwargs["model_data"])
+        super().__init__(
+            _load_data=functools.lru_cache(maxsize=data_cache_size)(load_data),
+            **kwargs
+        )
+
+    def get_tags(self, tag_ids) -> list:
+        """Tags with the given ids (ignoring unknown ones), sorted by code
+
+        Raises
+        ------
+        ValueError
+            If an id is not an integer
+        """
+        tags = {}
+        for tag_id in tag_ids:
+            try:
+                tag_id = int(tag_id)
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid tag id '{tag_id}'.") from None
+            tag = self.tags_by_id.get(tag_id)
+            if tag is not None:
+                tags[tag.id] = tag
+        return sorted(tags.values(), key=lambda tag: tag.code)
+
+    def get_data(self, tag_id: int) -> tuple:
+        """Examples of a tag (inside an application context)
+
+        Loaded from the database on first use, then served from the cache
+        of this snapshot, which is replaced whenever examples change.
+        """
+        if tag_id not in self.tags_by_id:
+            return ()
+        return self._load_data(tag_id)
+
+
+class Tagset(Frozen):
+    """Snapshot of the languages, tag information and tag categories"""
+
+    __slots__ = (
+        "version", "languages", "languages_by_id", "languages_by_code",
+        "tag_information", "categories"
+    )
+
+
+###############################################################################
+
+
+def load_records(model, *criteria, order_by=None) -> tuple:
+    record = RECORD_CLASSES[model]
+    statement = select(
+        *[getattr(model, name) for name in record._fields]
+    ).where(*criteria).order_by(order_by if order_by is not None else model.id)
+    return tuple(record(row) for row in db.session.execute(statement))
+
+
+def load_tag_data(model_data, tag_id: int) -> tuple:
+    return load_records(
+        model_data,
+        model_data.tag_id == tag_id,
+        model_data.is_deleted == False  # noqa
+    )
+
+
+def build_tagset(version: int = 0) -> Tagset:
+    """Build a snapshot of the tagset (inside an application context)
+
+    Only rows that are not deleted (and only visible tag information) are
+    included, as the public API shows them.
+    """
+    languages = load_records(Language, Language.is_deleted == False)  # noqa
+    categories = {}
+    for name, (model_tag, model_data) in TAG_MODEL_MAP.items():
+        tags = load_records(
+            model_tag,
+            model_tag.is_deleted == False,  # noqa
+            order_by=model_tag.code
+        )
+        categories[name] = Category(
+            name=name,
+            schema=TAG_SCHEMA[name],
+            model_data=model_data,
+            tags=tags,
+            tags_by_id=MappingProxyType({tag.id: tag for tag in tags}),
+            tags_by_code=MappingProxyType({tag.code: tag for tag in tags}),
+        )
+
+    return Tagset(
+        version=version,
+        languages=languages,
+        languages_by_id=MappingProxyType(
+            {language.id: language for language in languages}
+        ),
+        languages_by_code=MappingProxyType(
+            {language.code: language for language in languages}
+        ),
+        tag_information=load_records(
+            TagInformation, TagInformation.is_visible == True  # noqa
+        ),
+        categories=MappingProxyType(categories),
+    )
+
+
+###############################################################################
+
+
+class TagsetStore:
+    """Holder of the current tagset snapshot
+
+    The version of the tagset is kept in the `DataVersion` table, so that
+    a change made by any worker (or host) can be noticed by all of them.
+    `bump()` increments it after a change; a background thread in every
+    worker process polls it every `poll_interval` seconds and, when it has
+    changed, builds a new snapshot and swaps it in. Requests keep using
+    the previous snapshot in the meantime, and are never made to wait
+    for a rebuild, except for the very first load.
+
+    Functions registered with `on_reload` are called after every swap,
+    e.g. to clear caches derived from the tagset.
+    """
+
+    def __init__(self):
+        self.app = None
+        self.poll_interval = None
+        self._tagset = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._poller_pid = None
+        self._listeners = []
+
+    def init_app(self, app, poll_interval: float = None):
+        self.app = app
+        self.poll_interval = poll_interval
+
+    def on_reload(self, listener):
+        self._listeners.append(listener)
+        return listener
+
+    @property
+    def version(self) -> int:
+        tagset = self._tagset
+        return tagset.version if tagset is not None else None
+
+    def load(self, version: int = None) -> Tagset:
+        """Build a snapshot and swap it in (inside an application context)
+
+        The version is read from the database unless given.
+        """
+        with self._reload_lock:
+            if version is None:
+                version = get_data_version(TAGSET_VERSION)
+            tagset = build_tagset(version)
+            with self._lock:
+                # a reload of an older version may finish last
+                if self._tagset is not None and self._tagset.version > version:
+                    return self._tagset
+                self._tagset = tagset
+        LOGGER.info(f"Loaded tagset (version {version}).")
+
+        for listener in self._listeners:
+            try:
+                listener(tagset)
+            except Exception:
+                LOGGER.exception("Tagset reload listener failed.")
+        return tagset
+
+    def get(self) -> Tagset:
+        self.start_polling()
+        tagset = self._tagset
+        if tagset is None:
+            tagset = self.load()
+        return tagset
+
+    def bump(self):
+        """Mark the tagset as changed, for this and every other worker"""
+        version = bump_data_version(TAGSET_VERSION)
+        if self.app is not None:
+            self.reload_in_background(version)
+        else:
+            self.load(version)
+
+    # ----------------------------------------------------------------------- #
+
+    def reload_in_background(self, version: int = None):
+        threading.Thread(
+            target=self._reload, args=(version,), daemon=True
+        ).start()
+
+    def _reload(self, version: int = None):
+        try:
+            with self.app.app_context():
+                self.load(version)
+        except Exception:
+            LOGGER.exception("Could not reload the tagset.")
+
+    def start_polling(self):
+        """Start the polling thread of this process, if not running
+
+        Threads do not survive `fork()`, so this is checked (cheaply) on
+        every `get()` and the thread is started in each worker.
+        """
+        if not self.poll_interval or self.app is None:
+            return
+        pid = os.getpid()
+        if self._poller_pid == pid:
+            return
+        with self._lock:
+            if self._poller_pid == pid:
+                return
+            self._poller_pid = pid
+        threading.Thread(target=self._poll, daemon=True).start()
+
+    def _poll(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                with self.app.app_context():
+                    version = get_data_version(TAGSET_VERSION)
+                    if self.version != version:
+                        self.load(version)
+            except Exception:
+                LOGGER.exception("Could not check the tagset version.")
+
+
+TAGSET = TagsetStore()
+
+###############################################################################
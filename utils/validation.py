@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tag Validation for Annotated Corpora
+
+Checks the tags in the columns of a CoNLL-U or TSV corpus against the
+codes and tags of the corresponding Samanvaya categories, using sets
+precomputed from the in-memory tagset. Errors are reported as they are
+found; large files are validated in parallel, chunk by chunk, keeping the
+errors in order and only a few chunks in memory.
+
+    $ python3 utils/validation.py corpus.conllu
+    $ python3 utils/validation.py corpus.tsv -f tsv --header \\
+        -c pos=parts_of_speech_tag -c 4=dependency_tag -p 8
+
+The same check is available at `POST /api/validate/<format>`.
+
+@author: Hrishikesh Terdalkar
+"""
+
+###############################################################################
+
+import sys
+import logging
+import functools
+import multiprocessing
+from collections import deque, Counter
+
+###############################################################################
+
+LOGGER = logging.getLogger(__name__)
+
+###############################################################################
+
+FORMAT_CONLLU = "conllu"
+FORMAT_TSV = "tsv"
+FORMATS = (FORMAT_CONLLU, FORMAT_TSV)
+
+CONLLU_COLUMNS = (
+    "ID", "FORM", "LEMMA", "UPOS", "XPOS",
+    "FEATS", "HEAD", "DEPREL", "DEPS", "MISC"
+)
+DEFAULT_CONLLU_COLUMNS = {
+    "XPOS": "parts_of_speech_tag",
+    "DEPREL": "dependency_tag",
+}
+
+# value of an unannotated column
+EMPTY_VALUES = {"", "_"}
+
+CHUNK_SIZE = 20000  # lines
+
+###############################################################################
+
+
+@functools.lru_cache(maxsize=1)
+def get_vocabularies(tagset) -> dict:
+    """Valid labels (codes and tags) of every category of a tagset
+
+    Computed once per tagset snapshot.
+    """
+    return {
+        name: frozenset(
+            label.strip()
+            for tag in category.tags
+            for label in (tag.code, tag.tag)
+            if label
+        )
+        for name, category in tagset.categories.items()
+    }
+
+
+def parse_columns(specs: list, corpus_format: str,
+                  header: list = None) -> list:
+    """Resolve `column=category` specifications
+
+    A column is a CoNLL-U column name, a header name (TSV with a header)
+    or a column number, starting at 1.
+
+    Returns
+    -------
+    list
+        (index, column name, category) tuples
+
+    Raises
+    ------
+    ValueError
+        If a specification or column is not valid
+    """
+    names = list(CONLLU_COLUMNS) if corpus_format == FORMAT_CONLLU else header
+    if not specs:
+        if corpus_format != FORMAT_CONLLU:
+            raise ValueError("Columns to validate must be specified.")
+        specs = [f"{k}={v}" for k, v in DEFAULT_CONLLU_COLUMNS.items()]
+
+    columns = []
+    for spec in specs:
+        column, separator, category = spec.partition("=")
+        if not separator or not column or not category:
+            raise ValueError(f"Invalid column specification '{spec}'.")
+        if column.isdigit():
+            index = int(column) - 1
+            if index < 0:
+                raise ValueError(
+                    f"Invalid column '{column}', columns are numbered from 1."
+                )
+            name = names[index] if names and index < len(names) else column
+        elif names and column in names:
+            index = names.index(column)
+            name = column
+        else:
+            raise ValueError(f"Unknown column '{column}'.")
+        columns.append((index, name, category))
+    return columns
+
+
+###############################################################################
+
+
+class Validator:
+    """Check tag columns of corpus lines against category vocabularies
+
+    Parameters
+    ----------
+    vocabularies : dict
+        Category -> set of valid labels
+    columns : list
+        (index, column name, category) tuples, see `parse_columns()`
+    corpus_format : str
+        "conllu" or "tsv"
+    """
+
+    def __init__(self, vocabularies: dict, columns: list,
+                 corpus_format: str = FORMAT_CONLLU):
+        unknown = {c for _, _, c in columns if c not in vocabularies}
+        if unknown:
+            raise ValueError(f"Unknown categories: {', '.join(sorted(unknown))}")
+        if corpus_format not in FORMATS:
+            raise ValueError(f"Unknown format '{corpus_format}'.")
+
+        self.columns = columns
+        self.corpus_format = corpus_format
+        self.vocabularies = {c: vocabularies[c] for _, _, c in columns}
+        # case and spacing mistakes are reported with a suggestion
+        self.suggestions = {
+            category: {label.lower(): label for label in vocabulary}
+            for category, vocabulary in self.vocabularies.items()
+        }
+        self.counts = Counter()
+
+    def validate(self, lines, first_line: int = 1):
+        """Errors in `lines` as dicts, `first_line` being the line number
+        of the first one; `counts` are updated as lines are read
+
+        Values that are not valid labels of their category, and columns
+        missing from a line, are errors.
+        """
+        conllu = self.corpus_format == FORMAT_CONLLU
+        counts = self.counts
+        for line_number, line in enumerate(lines, first_line):
+            counts["lines"] += 1
+            line = line.rstrip("\r\n")
+            if not line or (conllu and line.startswith("#")):
+                continue
+            fields = line.split("\t")
+            # multi-word token ranges and empty nodes carry no tags
+            if conllu and ("-" in fields[0] or "." in fields[0]):
+                continue
+
+            counts["tokens"] += 1
+            for index, name, category in self.columns:
+                if index >= len(fields):
+                    counts["errors"] += 1
+                    yield {
+                        "line": line_number,
+                        "column": name,
+                        "value": None,
+                        "category": category,
+                        "suggestion": None,
+                        "message": "Missing column.",
+                    }
+                    continue
+                value = fields[index].strip()
+                if value in EMPTY_VALUES:
+                    continue
+                counts["values"] += 1
+                if value in self.vocabularies[category]:
+                    continue
+
+                counts["errors"] += 1
+                yield {
+                    "line": line_number,
+                    "column": name,
+                    "value": value,
+                    "category": category,
+                    "suggestion": self.suggestions[category].get(
+                        value.lower()
+                    ),
+                    "message": "Unknown tag.",
+                }
+
+    def process_chunk(self, first_line: int, lines: list):
+        """Errors and counts of one chunk, see `process_parallel()`"""
+        counts = self.counts
+        self.counts = Counter()
+        errors = list(self.validate(lines, first_line))
+        chunk_counts, self.counts = self.counts, counts
+        return errors, chunk_counts
+
+    def update(self, counts: Counter):
+        self.counts.update(counts)
+
+
+###############################################################################
+# Parallel Processing
+
+
+_PROCESSOR = {}
+
+
+def init_worker(processor):
+    _PROCESSOR["processor"] = processor
+
+
+def process_chunk(task):
+    return _PROCESSOR["processor"].process_chunk(*task)
+
+
+def read_chunks(lines, chunk_size: int = CHUNK_SIZE, first_line: int = 1):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == chunk_size:
+            yield first_line, chunk
+            first_line += len(chunk)
+            chunk = []
+    if chunk:
+        yield first_line, chunk
+
+
+def process_parallel(processor, lines, processes: int = None,
+                     chunk_size: int = CHUNK_SIZE, first_line: int = 1):
+    """Process `lines` chunk by chunk in worker processes
+
+    `processor.process_chunk(first_line, lines)` is called in the workers
+    and returns a list of results and a report, which is passed to
+    `processor.update(report)` in this process. Results are yielded in
+    order. At most two chunks per process are read ahead, so memory use
+    does not grow with the size of the input.
+    """
+    processes = processes or multiprocessing.cpu_count()
+    with multiprocessing.Pool(
+        processes, initializer=init_worker, initargs=(processor,)
+    ) as pool:
+        pending = deque()
+        for task in read_chunks(lines, chunk_size, first_line):
+            pending.append(pool.apply_async(process_chunk, (task,)))
+            while len(pending) >= 2 * processes:
+                yield from _collect(processor, pending.popleft())
+        while pending:
+            yield from _collect(processor, pending.popleft())
+
+
+def _collect(processor, result):
+    results, report = result.get()
+    processor.update(report)
+    return results
+
+
+###############################################################################
+
+
+if __name__ == "__main__":
+    import os
+    import argparse
+
+    sys.path.insert(
+        0, os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+    )
+
+    parser = argparse.ArgumentParser(description="Validate corpus tags")
+    parser.add_argument(
+        "corpus", nargs="?", default="-",
+        help="Corpus file (default: standard input)"
+    )
+    parser.add_argument(
+        "-f", "--format", choices=FORMATS, default=FORMAT_CONLLU,
+        help="Corpus format (default: conllu)"
+    )
+    parser.add_argument(
+        "-c", "--column", action="append", dest="columns", default=[],
+        help="Column to validate as COLUMN=CATEGORY (repeatable). "
+             "Default for CoNLL-U: XPOS=parts_of_speech_tag, "
+             "DEPREL=dependency_tag"
+    )
+    parser.add_argument(
+        "--header", action="store_true",
+        help="The first line of the TSV file holds the column names"
+    )
+    parser.add_argument(
+        "-p", "--processes", type=int, default=None,
+        help="Number of worker processes (default: number of CPUs, 1 to "
+             "validate in this process)"
+    )
+    args = vars(parser.parse_args())
+
+    logging.basicConfig(level=logging.WARNING)
+
+    import server
+    from utils.tagset import TAGSET
+
+    with server.webapp.app_context():
+        _vocabularies = get_vocabularies(TAGSET.get())
+
+    # bytes that are not valid UTF-8 show up in the reported values
+    if args["corpus"] == "-":
+        sys.stdin.reconfigure(encoding="utf-8", errors="replace")
+    _stream = (
+        sys.stdin
+        if args["corpus"] == "-"
+        else open(args["corpus"], encoding="utf-8", errors="replace")
+    )
+    with _stream:
+        _header = None
+        _first_line = 1
+        if args["header"]:
+            _header = _stream.readline().rstrip("\r\n").split("\t")
+            _first_line = 2
+        try:
+            _validator = Validator(
+                _vocabularies,
+                parse_columns(args["columns"], args["format"], _header),
+                args["format"]
+            )
+        except ValueError as e:
+            parser.error(str(e))
+
+        if args["processes"] == 1:
+            _errors = _validator.validate(_stream, _first_line)
+        else:
+            _errors = process_parallel(
+                _validator, _stream, args["processes"], first_line=_first_line
+            )
+        for _error in _errors:
+            print(
+                f"{_error['line']}\t{_error['column']}\t"
+                f"{_error['value'] or ''}\t{_error['category']}\t"
+                f"{_error['suggestion'] or ''}\t{_error['message']}"
+            )
+
+    _counts = _validator.counts
+    print(
+        f"{_counts['lines']} lines, {_counts['tokens']} tokens, "
+        f"{_counts['values']} tags checked, {_counts['errors']} errors",
+        file=sys.stderr
+    )
+    sys.exit(1 if _counts["errors"] else 0)
+
+###############################################################################